@@ -1,241 +1,1007 @@
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, Response, g, jsonify, request, render_template, stream_with_context
 from markupsafe import escape
 import os
 import json
-from typing import List, Dict, Any
+import re
+import hashlib
+import zlib
+import uuid
+import secrets
+import contextvars
+import threading
+import heapq
+import math
+import queue
+import sqlite3
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
 import time
+import random
+import atexit
+from contextlib import contextmanager
 
 try:
     import anthropic
 except ImportError:
     anthropic = None
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from gevent import monkey as gevent_monkey
+except ImportError:
+    gevent_monkey = None
+
 app = Flask(__name__)
+app.logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
 
 # Configure Claude API from environment
 ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY')
 CLAUDE_MODEL = os.environ.get('CLAUDE_MODEL', 'claude-3-haiku-20240307')
 
+# One pooled HTTP client per worker process, shared by every request. Under
+# the gevent worker (see gunicorn.conf.py) max connections bounds how many
+# Claude calls a worker can have in flight at once.
+#
+# SDK retries are off: every call goes through ClaudeScheduler, and a retry
+# inside the SDK would spend extra provider requests against a single admitted
+# slot and hide 429s from the scheduler's throttle.
+CLAUDE_MAX_CONNECTIONS = int(os.environ.get('CLAUDE_MAX_CONNECTIONS', 100))
+CLAUDE_MAX_KEEPALIVE = int(os.environ.get('CLAUDE_MAX_KEEPALIVE', 20))
+CLAUDE_KEEPALIVE_EXPIRY = float(os.environ.get('CLAUDE_KEEPALIVE_EXPIRY', 30))
+
 if anthropic and ANTHROPIC_API_KEY:
-    claude = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+    # Build the limits from the SDK's own default so they match whichever
+    # httpx package that SDK version ships with.
+    _default_limits = getattr(anthropic, 'DEFAULT_CONNECTION_LIMITS', None)
+    if _default_limits is not None:
+        claude = anthropic.Anthropic(
+            api_key=ANTHROPIC_API_KEY,
+            max_retries=0,
+            http_client=anthropic.DefaultHttpxClient(
+                limits=type(_default_limits)(
+                    max_connections=CLAUDE_MAX_CONNECTIONS,
+                    max_keepalive_connections=CLAUDE_MAX_KEEPALIVE,
+                    keepalive_expiry=CLAUDE_KEEPALIVE_EXPIRY,
+                )
+            )
+        )
+    else:
+        app.logger.warning("anthropic SDK has no DEFAULT_CONNECTION_LIMITS; using its default connection pool")
+        claude = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, max_retries=0)
 else:
     claude = None
 
+# Bump whenever the generation prompt changes so cached ideas from the old
+# prompt are not served for the new one.
+IDEA_PROMPT_VERSION = 'reels-v2'
+
+# Multi-idea generation: each idea is its own request fanned out over a
+# bounded pool, and the whole batch shares one wall-clock deadline.
+IDEA_DEADLINE = float(os.environ.get('IDEA_DEADLINE', 25))
+IDEA_FANOUT_WORKERS = int(os.environ.get('IDEA_FANOUT_WORKERS', 8))
+IDEA_MAX_COUNT = int(os.environ.get('IDEA_MAX_COUNT', 6))
+
+# Bulk generation (POST /content-catalyst/batch and bulk.py)
+IDEA_BATCH_CONCURRENCY = int(os.environ.get('IDEA_BATCH_CONCURRENCY', 4))
+IDEA_BATCH_MAX_CONCURRENCY = int(os.environ.get('IDEA_BATCH_MAX_CONCURRENCY', 16))
+IDEA_BATCH_MAX_ITEMS = int(os.environ.get('IDEA_BATCH_MAX_ITEMS', 1000))
+
+# Sync gunicorn workers don't heartbeat while streaming a body, so a batch
+# served by one must finish inside the worker timeout (see gunicorn.conf.py).
+GUNICORN_TIMEOUT = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+# Similarity cache for near-duplicate descriptions (needs numpy; see
+# SimilarityIndex below). IDEA_SIMILAR_MAX=0 disables it.
+IDEA_SIMILAR_THRESHOLD = float(os.environ.get('IDEA_SIMILAR_THRESHOLD', 0.75))
+IDEA_SIMILAR_MAX = int(os.environ.get('IDEA_SIMILAR_MAX', 20000))
+IDEA_SIMILAR_DIM = int(os.environ.get('IDEA_SIMILAR_DIM', 256))
+
+# Follow-up chat sessions (see IdeaSessionStore below)
+IDEA_SESSION_TTL = int(os.environ.get('IDEA_SESSION_TTL', 2 * 3600))
+IDEA_SESSION_MAX = int(os.environ.get('IDEA_SESSION_MAX', 2000))
+IDEA_SESSION_MAX_BYTES = int(os.environ.get('IDEA_SESSION_MAX_BYTES', 16 * 1024 * 1024))
+IDEA_CHAT_HISTORY_TOKENS = int(os.environ.get('IDEA_CHAT_HISTORY_TOKENS', 1500))
+IDEA_CHAT_SUMMARY_CHARS = 600
+
+# Fraction of successful Claude responses whose raw text is logged (failed
+# parses are always logged).
+RAW_RESPONSE_SAMPLE_RATE = float(os.environ.get('RAW_RESPONSE_SAMPLE_RATE', 0))
+
+# Circuit breaker around Claude calls (see CircuitBreaker below). Calls
+# slower than CLAUDE_BREAKER_SLOW_CALL seconds count as failures.
+CLAUDE_BREAKER_WINDOW = float(os.environ.get('CLAUDE_BREAKER_WINDOW', 60))
+CLAUDE_BREAKER_MIN_CALLS = int(os.environ.get('CLAUDE_BREAKER_MIN_CALLS', 5))
+CLAUDE_BREAKER_ERROR_RATE = float(os.environ.get('CLAUDE_BREAKER_ERROR_RATE', 0.5))
+CLAUDE_BREAKER_SLOW_CALL = float(os.environ.get('CLAUDE_BREAKER_SLOW_CALL', 20))
+CLAUDE_BREAKER_COOLDOWN = float(os.environ.get('CLAUDE_BREAKER_COOLDOWN', 30))
+CLAUDE_BREAKER_PROBES = int(os.environ.get('CLAUDE_BREAKER_PROBES', 1))
+
+# Optional hedging: if Claude hasn't answered within this many seconds,
+# serve the local ideas instead (0 disables). The Claude call keeps running
+# and fills the generation cache for the next request. Hedged calls run on
+# their own pool of CLAUDE_HEDGE_WORKERS threads; when all of them are busy
+# (abandoned calls still running) requests wait for Claude without a hedge.
+CLAUDE_HEDGE_SLO = float(os.environ.get('CLAUDE_HEDGE_SLO', 0))
+CLAUDE_HEDGE_WORKERS = int(os.environ.get('CLAUDE_HEDGE_WORKERS', 8))
+
+# Outbound Claude budget (see ClaudeScheduler below). CLAUDE_RPM and
+# CLAUDE_TPM are account-wide and split evenly across WEB_CONCURRENCY
+# workers; 0 disables a limit.
+CLAUDE_RPM = float(os.environ.get('CLAUDE_RPM', 0))
+CLAUDE_TPM = float(os.environ.get('CLAUDE_TPM', 0))
+CLAUDE_MAX_CONCURRENCY = int(os.environ.get('CLAUDE_MAX_CONCURRENCY', 32))
+CLAUDE_QUEUE_MAX = int(os.environ.get('CLAUDE_QUEUE_MAX', 100))
+CLAUDE_QUEUE_TIMEOUT = float(os.environ.get('CLAUDE_QUEUE_TIMEOUT', 10))
+
+# Model routing (see ModelRouter below). Complex descriptions go to
+# CLAUDE_MODEL_STRONG while it meets the endpoint's latency target (seconds,
+# p95), and ideas that fail validation are retried on it. Empty disables both.
+CLAUDE_MODEL_STRONG = os.environ.get('CLAUDE_MODEL_STRONG', '')
+CLAUDE_LATENCY_TARGETS = os.environ.get('CLAUDE_LATENCY_TARGETS', 'ideas=10,stream=15,batch=60,followup=8')
+CLAUDE_ROUTER_COMPLEX_WORDS = int(os.environ.get('CLAUDE_ROUTER_COMPLEX_WORDS', 120))
+
+# Either model can answer an idea request (routed pick or escalation), so
+# cached and similarity-served ideas are keyed on both: changing either
+# model invalidates them.
+IDEA_ROUTED_MODELS = '+'.join(m for m in (CLAUDE_MODEL, CLAUDE_MODEL_STRONG) if m)
+
+# Generation cache sizing (see GenerationCache below)
+IDEA_CACHE_TTL = int(os.environ.get('IDEA_CACHE_TTL', 3600))
+IDEA_CACHE_MAX_ENTRIES = int(os.environ.get('IDEA_CACHE_MAX_ENTRIES', 512))
+IDEA_CACHE_MAX_BYTES = int(os.environ.get('IDEA_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+
+# Capped at IDEA_CACHE_TTL: once an exact-cache entry expires, the same
+# description would otherwise match itself in the similarity index, so this
+# cap keeps IDEA_CACHE_TTL the bound on how stale a served idea can be.
+IDEA_SIMILAR_TTL = min(int(os.environ.get('IDEA_SIMILAR_TTL', IDEA_CACHE_TTL)), IDEA_CACHE_TTL)
+
+# Persistent idea history shared by all workers (see IdeaStore below).
+# An empty IDEA_DB_PATH disables it.
+IDEA_DB_PATH = os.environ.get('IDEA_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ideas.db'))
+IDEA_DB_QUEUE_SIZE = int(os.environ.get('IDEA_DB_QUEUE_SIZE', 10000))
+# Cookie holding each browser's random client token. History endpoints only
+# return ideas generated under the caller's token.
+IDEA_OWNER_COOKIE = os.environ.get('IDEA_OWNER_COOKIE', 'idea_client')
+IDEA_OWNER_COOKIE_MAX_AGE = int(os.environ.get('IDEA_OWNER_COOKIE_MAX_AGE', 365 * 24 * 3600))
+
+
+class Metrics:
+    """Minimal in-process Prometheus-style registry (counters and histograms).
+
+    Each gunicorn worker has its own registry, so a scrape of /metrics sees
+    the worker that served it; aggregate across workers in Prometheus.
+    """
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple], List[float]] = {}
+        self._help: Dict[str, Tuple[str, str]] = {}
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            # bucket counts (non-cumulative), then sum and count
+            hist = self._histograms.setdefault(key, [0] * (len(self.BUCKETS) + 2))
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    hist[i] += 1
+                    break
+            hist[-2] += value
+            hist[-1] += 1
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """Time a block (or, as a decorator, a function) as ``idea_stage_seconds{stage}``."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('idea_stage_seconds', time.perf_counter() - started, stage=stage)
+
+    def render(self) -> str:
+        """Prometheus text exposition of everything recorded so far."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, list(v)) for k, v in self._histograms.items())
+        lines = []
+        seen = set()
+
+        def header(name):
+            if name not in seen and name in self._help:
+                kind, help_text = self._help[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+            seen.add(name)
+
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), hist in histograms:
+            header(name)
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS, hist):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {hist[-1]:g}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {hist[-2]:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {hist[-1]:g}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels: Tuple) -> str:
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+metrics = Metrics()
+metrics.describe('idea_stage_seconds', 'histogram',
+                 'Time spent per generation stage (queue_wait, prompt_build, api_wait, parse, validate, fallback, '
+                 'followup_queue_wait, followup_api_wait).')
+metrics.describe('claude_errors_total', 'counter', 'Claude call failures by call kind and error class.')
+metrics.describe('claude_shed_total', 'counter', 'Claude calls rejected by the scheduler by kind, priority and reason.')
+metrics.describe('claude_route_total', 'counter', 'Claude calls by endpoint latency target and routed model.')
+metrics.describe('claude_hedge_skipped_total', 'counter', 'Requests not hedged because every hedge thread was busy.')
+metrics.describe('claude_escalations_total', 'counter', 'Idea responses retried after failing validation, by reason.')
+metrics.describe('claude_escalations_skipped_total', 'counter',
+                 'Idea responses not retried because too little of the timeout was left, by reason.')
+metrics.describe('claude_tokens_total', 'counter', 'Tokens reported in message.usage by call kind and token type.')
+metrics.describe('http_request_duration_seconds', 'histogram', 'Request time by endpoint and status, including streamed bodies.')
+
+
+def _api_error_class(e: BaseException) -> str:
+    """Classify a Claude client exception for claude_errors_total."""
+    if getattr(e, 'status_code', None) == 429:
+        return 'rate_limited'
+    return 'timeout' if 'timeout' in type(e).__name__.lower() else 'api'
+
+
+# Scheduling priorities for outbound Claude calls (lower runs first)
+PRIORITY_CHAT = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BATCH = 2
+PRIORITY_NAMES = {PRIORITY_CHAT: 'chat', PRIORITY_INTERACTIVE: 'interactive', PRIORITY_BATCH: 'batch'}
+
+
+# Per-field length limits applied when cleaning an idea returned by Claude
+IDEA_FIELD_LIMITS = {
+    'format': 100,
+    'title': 200,
+    'caption': 1000,
+    'script': 1000,
+    'scriptFull': 2000,
+    'tone': 50,
+    'duration': 20,
+}
+IDEA_REQUIRED_FIELDS = ['format', 'title', 'caption', 'script', 'scriptFull', 'tone', 'duration', 'apps']
+
+# Creative angles used to keep fanned-out single-idea requests from all
+# returning the same idea.
+IDEA_ANGLES = [
+    'before/after transformation',
+    'customer reaction or testimonial',
+    'behind-the-scenes',
+    'myth-busting or hot take',
+    'day-in-the-life',
+    'quick tutorial or hack',
+]
+
+
+# Static generation instructions, built once at import. Sent as a cacheable
+# system prefix; only the business description varies per request.
+IDEA_SYSTEM_PROMPT = (
+    "You are an expert social media strategist who specializes in modern Instagram Reels and short-form marketing aimed at young adults (18-35).\n\n"
+    "Style & tone guidance:\n"
+    "- Casual, witty, meme-native; playful sarcasm is ok when appropriate.\n"
+    "- Immediate-action focus: strong 1-3s hook, product/demo visible within 3-5s, direct CTA.\n"
+    "- Visual cues: UGC/creator-led, reaction close-ups, jump cuts, text overlays, fast pacing, 9:16 aspect ratio.\n"
+    "- Keep language short, conversational, and punchy — avoid corporate phrasing.\n\n"
+    "Output requirements (MUST follow exactly):\n"
+    "Return ONLY a single valid JSON object using this exact schema with one idea in the ideas array. No extra text.\n"
+    "{\n"
+    "  \"ideas\": [\n"
+    "    {\n"
+    "      \"format\": \"Reel/TikTok (9:16)\",\n"
+    "      \"title\": \"Short catchy title\",\n"
+    "      \"caption\": \"One-line hook (<=8 words)\",\n"
+    "      \"script\": \"Hook: ...\\nProblem: ...\\nSolution: ...\\nCTA: ...\",\n"
+    "      \"scriptFull\": \"Shot-by-shot with timings (e.g., 0-3s hook; 3-8s demo; 8-12s CTA)\",\n"
+    "      \"editingNotes\": [\"jump cuts\", \"face close-ups\", \"text overlay suggestions\"],\n"
+    "      \"tone\": \"casual/witty/energetic\",\n"
+    "      \"duration\": \"15s/30s/45s\",\n"
+    "      \"apps\": [\"CapCut\", \"InShot\"]\n"
+    "    }\n"
+    "  ]\n"
+    "}\n\n"
+    "Additional rules:\n"
+    "1) Keep hooks visceral and attention-grabbing (reaction, surprising visual, or audio jump).\n"
+    "2) Editing notes must include at least 2 concrete actionable tips (cuts, overlays, pacing, audio).\n"
+    "3) Prioritize 15-30s Reels for younger audiences; allow 45-60s only if there is a clear storytelling reason.\n"
+    "4) No prose outside the JSON object; do not include examples, explanations, or comments.\n"
+    "5) No trailing commas or JSON comments.\n\n"
+    "Every idea you generate must have:\n"
+    "1. Strong hook in first 3 seconds\n"
+    "2. Clear problem-solution structure\n"
+    "3. Keep it under 60 seconds\n"
+    "4. Focus on key benefits\n"
+    "5. End with clear call-to-action\n"
+)
+IDEA_SYSTEM_BLOCKS = [
+    {"type": "text", "text": IDEA_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}
+]
+IDEA_USER_TEMPLATE = (
+    "Generate ONE short-form video idea for this business:\n\n"
+    "{description}\n\n"
+    "Format as clean JSON exactly matching the structure shown."
+)
+
+
+def build_idea_prompt(business_description: str, angle: Optional[str] = None) -> Tuple[List[Dict[str, Any]], str]:
+    """Return the ``(system, user)`` prompt pair for a single idea generation.
+
+    ``system`` is the shared, cache-marked instruction prefix; everything
+    specific to the request goes in ``user``. ``angle`` optionally steers
+    the idea towards a creative angle.
+    """
+    user = IDEA_USER_TEMPLATE.format(description=business_description)
+    if angle:
+        user += f"\n\nCreative angle for this idea: {angle}."
+    return IDEA_SYSTEM_BLOCKS, user
+
+
+def build_idea_request(business_description: str, angle: Optional[str] = None, model: Optional[str] = None,
+                       max_tokens: Optional[int] = None) -> Dict[str, Any]:
+    """Return the ``messages.create`` parameters for a single idea generation.
+
+    Shared by the blocking, streaming and Message Batches code paths so they
+    all send exactly the same prompt. ``model`` and ``max_tokens`` default
+    to CLAUDE_MODEL and the full idea budget; callers pass the router's pick.
+    """
+    with metrics.timer('prompt_build'):
+        system, user = build_idea_prompt(business_description, angle)
+    return {
+        'model': model or CLAUDE_MODEL,
+        'max_tokens': max_tokens or ModelRouter.DEFAULT_MAX_TOKENS['ideas'],
+        'temperature': 0.7,
+        'system': system,
+        'messages': [
+            {"role": "user", "content": user}
+        ],
+    }
+
+
+def clean_idea(idea: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate a single raw idea from Claude and return a cleaned, truncated copy.
+
+    Raises:
+        ValueError: If required fields are missing, empty or of the wrong type
+    """
+    # Required fields
+    missing_fields = [f for f in IDEA_REQUIRED_FIELDS if f not in idea]
+    if missing_fields:
+        raise ValueError(f"Idea missing required fields: {', '.join(missing_fields)}")
+    
+    # Validate required fields and types
+    if not isinstance(idea.get('apps', []), list):
+        raise ValueError("'apps' field must be an array")
+
+    # Generate editing notes from scriptFull if not provided
+    editing_notes = []
+    if "time-lapse" in idea['scriptFull'].lower():
+        editing_notes.append("Create time-lapse sequence")
+    if "transition" in idea['scriptFull'].lower():
+        editing_notes.append("Add smooth transitions between scenes")
+    if "montage" in idea['scriptFull'].lower():
+        editing_notes.append("Fast-paced editing for montage")
+    if "CTA" in idea['scriptFull']:
+        editing_notes.append("Add text overlay for call-to-action")
+    editing_notes.append("Use upbeat background music")
+    editing_notes.append("Add on-screen text for key points")
+
+    # Clean and validate the idea
+    cleaned = {
+        'format': str(idea['format'])[:IDEA_FIELD_LIMITS['format']],
+        'title': str(idea['title'])[:IDEA_FIELD_LIMITS['title']],
+        'caption': str(idea['caption'])[:IDEA_FIELD_LIMITS['caption']],
+        'script': str(idea['script'])[:IDEA_FIELD_LIMITS['script']],
+        'scriptFull': str(idea['scriptFull'])[:IDEA_FIELD_LIMITS['scriptFull']],
+        'editingNotes': editing_notes,
+        'tone': str(idea['tone'])[:IDEA_FIELD_LIMITS['tone']],
+        'duration': str(idea['duration'])[:IDEA_FIELD_LIMITS['duration']],
+        'apps': [str(x)[:100] for x in idea['apps']][:5]
+    }
+    
+    # Verify all fields have content
+    empty_fields = [k for k, v in cleaned.items() if not v]
+    if empty_fields:
+        raise ValueError(f"Empty required fields: {', '.join(empty_fields)}")
+    return cleaned
+
+
+# Structural characters outside / special characters inside JSON strings,
+# used by extract_json_object to jump between interesting positions.
+_JSON_STRUCTURAL_RE = re.compile(r'[{}\[\]",/]')
+_JSON_STRING_SPECIAL_RE = re.compile(r'["\\\x00-\x1f]')
+_JSON_CONTROL_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+_JSON_DECODER = json.JSONDecoder()
+
+
+def extract_json_object(text: str) -> Dict[str, Any]:
+    """Extract and decode the first balanced top-level JSON object in ``text``.
+
+    Makes a single pass from the first ``{``, jumping between structural
+    characters and tracking strings and escapes, so braces inside string
+    values and prose or code fences around the object don't matter. While
+    scanning it repairs common model defects: trailing commas before ``}``
+    or ``]`` (also with a comment in between), ``//`` and ``/* */``
+    comments, and raw control characters (e.g. literal newlines) inside
+    strings.
+
+    Most responses need no repair, so the C decoder is tried first from
+    the first ``{``; the scan only runs when that fails. If the balanced
+    span found by the scan still doesn't decode (e.g. a template-style
+    ``{your brand}`` in prose before the JSON), scanning resumes from the
+    next ``{`` after it started.
+
+    Raises:
+        ValueError: If there is no complete object or it doesn't decode
+    """
+    start = text.find('{')
+    if start < 0:
+        raise ValueError("No JSON object found in response")
+    error = None
+    while start >= 0:
+        try:
+            data, _ = _JSON_DECODER.raw_decode(text, start)
+            return data
+        except json.JSONDecodeError:
+            pass
+        try:
+            data = json.loads(_repair_json_object(text, start))
+        except json.JSONDecodeError as e:
+            error = error or ValueError(f"Invalid JSON: {str(e)}")
+            start = text.find('{', start + 1)
+            continue
+        if not isinstance(data, dict):
+            raise ValueError("No JSON object found in response")
+        return data
+    raise error
+
+
+def _repair_json_object(text: str, start: int) -> str:
+    """Repaired text of the balanced object starting at ``text[start]``
+    (see ``extract_json_object``).
+
+    Raises:
+        ValueError: If the object never closes
+    """
+    pieces = []           # repaired text, flushed lazily from text[seg:]
+    seg = start
+    depth = 0
+    last_comma = -1       # position of the last comma seen outside strings
+    comma_piece = None    # index in pieces of a piece starting with a comma
+                          # that only comments have followed so far
+    pos = start
+    end = -1
+    while end < 0:
+        m = _JSON_STRUCTURAL_RE.search(text, pos)
+        if m is None:
+            raise ValueError("No complete JSON object found")
+        i = m.start()
+        ch = text[i]
+        pos = i + 1
+
+        if ch == '"':
+            last_comma = -1
+            comma_piece = None
+            while True:
+                s = _JSON_STRING_SPECIAL_RE.search(text, pos)
+                if s is None:
+                    raise ValueError("No complete JSON object found")
+                j = s.start()
+                sc = text[j]
+                if sc == '"':
+                    pos = j + 1
+                    break
+                if sc == '\\':
+                    pos = j + 2
+                    continue
+                pieces.append(text[seg:j])
+                pieces.append(_JSON_CONTROL_ESCAPES.get(sc, f'\\u{ord(sc):04x}'))
+                seg = pos = j + 1
+        elif ch == ',':
+            last_comma = i
+            comma_piece = None
+        elif ch == '/':
+            nxt = text[i + 1:i + 2]
+            if nxt == '/':
+                stop = text.find('\n', i)
+                stop = len(text) if stop < 0 else stop
+            elif nxt == '*':
+                stop = text.find('*/', i + 2)
+                stop = len(text) if stop < 0 else stop + 2
+            else:
+                continue
+            # Dropping the comment moves seg past a pending comma, so keep
+            # the comma as the start of its own piece in case a close follows.
+            if last_comma >= seg and not text[last_comma + 1:i].strip():
+                pieces.append(text[seg:last_comma])
+                seg = last_comma
+                comma_piece = len(pieces)
+            elif text[seg:i].strip():
+                comma_piece = None
+            last_comma = -1
+            pieces.append(text[seg:i])
+            seg = pos = stop
+        elif ch in '{[':
+            depth += 1
+            last_comma = -1
+            comma_piece = None
+        else:
+            if last_comma >= seg and not text[last_comma + 1:i].strip():
+                pieces.append(text[seg:last_comma])
+                seg = last_comma + 1
+            elif comma_piece is not None and not text[seg:i].strip():
+                pieces[comma_piece] = pieces[comma_piece][1:]
+            last_comma = -1
+            comma_piece = None
+            depth -= 1
+            if depth == 0:
+                end = i + 1
+
+    pieces.append(text[seg:end])
+    return ''.join(pieces)
+
+
+def parse_ideas_response(text: str, max_ideas: int = 1) -> List[Dict[str, Any]]:
+    """Extract the JSON object from a raw Claude response and return cleaned ideas.
+
+    Raises:
+        ValueError: If no valid ideas JSON can be extracted
+    """
+    try:
+        with metrics.timer('parse'):
+            data = extract_json_object(text)
+    except ValueError:
+        metrics.inc('claude_errors_total', kind='ideas', error='json_parse')
+        app.logger.warning("\n=== Raw Claude response ===\n%s\n===========================", text)
+        raise
+    if RAW_RESPONSE_SAMPLE_RATE and random.random() < RAW_RESPONSE_SAMPLE_RATE:
+        app.logger.info("\n=== Raw Claude response (sampled) ===\n%s\n===========================", text)
+        
+    try:
+        with metrics.timer('validate'):
+            if 'ideas' not in data:
+                raise ValueError("Response missing 'ideas' array")
+                
+            ideas = data['ideas']
+            if not isinstance(ideas, list):
+                raise ValueError("'ideas' must be an array")
+                
+            # Validate and clean each idea
+            return [clean_idea(idea) for idea in ideas[:max_ideas] if isinstance(idea, dict)]
+    except ValueError:
+        metrics.inc('claude_errors_total', kind='ideas', error='missing_fields')
+        raise
+
+
+class IdeaFieldStream:
+    """Incremental scanner that reports idea fields as soon as they close.
+
+    Feed it text deltas from a streaming Claude response; each call to
+    ``feed`` returns ``(idea_index, field, value)`` tuples for every field of
+    an object inside the ``ideas`` array that completed in that chunk. Only
+    structural characters outside of strings are tracked, so braces and
+    commas inside string values do not confuse it. Anything that doesn't
+    decode is skipped here; the full response is still validated at the end
+    by ``parse_ideas_response``.
+    """
+
+    # Nesting of an idea object: root object -> ideas array -> idea object
+    IDEA_DEPTH = ['{', '[', '{']
+
+    def __init__(self):
+        self.buffer = ''
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self._idea_index = -1
+
+    def feed(self, chunk: str) -> List[Tuple[int, str, Any]]:
+        self.buffer += chunk
+        fields = []
+        buf = self.buffer
+        for i in range(self._pos, len(buf)):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._expect_key and self._stack == self.IDEA_DEPTH:
+                        try:
+                            self._key = json.loads(buf[self._string_start:i + 1])
+                        except ValueError:
+                            self._key = None
+                continue
+
+            at_idea_level = self._stack == self.IDEA_DEPTH
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in '{[':
+                self._stack.append(ch)
+                if self._stack == self.IDEA_DEPTH:
+                    self._idea_index += 1
+                    self._expect_key = True
+                    self._key = None
+            elif ch in '}]':
+                if at_idea_level:
+                    fields.extend(self._close_field(i))
+                if self._stack:
+                    self._stack.pop()
+            elif at_idea_level and ch == ':':
+                self._expect_key = False
+                self._value_start = i + 1
+            elif at_idea_level and ch == ',':
+                fields.extend(self._close_field(i))
+                self._expect_key = True
+        self._pos = len(buf)
+        return fields
+
+    def _close_field(self, end: int) -> List[Tuple[int, str, Any]]:
+        key, start = self._key, self._value_start
+        self._key = None
+        self._value_start = None
+        if key is None or start is None:
+            return []
+        try:
+            value = json.loads(self.buffer[start:end])
+        except ValueError:
+            return []
+        return [(self._idea_index, key, value)]
 
-def call_claude_for_ideas(business_description: str, max_ideas: int = 1, timeout: int = 25) -> List[Dict[str, Any]]:
+def call_claude_for_ideas(business_description: str, max_ideas: int = 1, timeout: float = 25,
+                          angle: Optional[str] = None, priority: int = PRIORITY_INTERACTIVE) -> List[Dict[str, Any]]:
     """Generate video content ideas using Claude API.
     
     Args:
         business_description: Text describing the business and goals
         max_ideas: Maximum number of ideas to generate
-        timeout: API timeout in seconds
+        timeout: Seconds for the whole call: scheduler queue wait, the API
+            call and, if the response fails validation, the escalation
+            retry, which only gets what is left.
+        angle: Optional creative angle passed to the prompt
+        priority: Scheduler priority (PRIORITY_INTERACTIVE or PRIORITY_BATCH);
+            batch calls are routed against the 'batch' latency target
         
     Returns:
         List of idea dictionaries with keys: type, title, description, example, etc.
         
     Raises:
         RuntimeError: If Claude is not configured or API call fails
+        ClaudeOverloadedError: If the scheduler sheds the call
     """
     if not anthropic or not claude:
         raise RuntimeError("Claude API not configured - set ANTHROPIC_API_KEY")
         
-    # Construct a detailed prompt that ensures JSON output tailored for modern Instagram Reels
-    system = (
-        "You are an expert social media strategist who specializes in modern Instagram Reels and short-form marketing aimed at young adults (18-35).\n\n"
-        "Style & tone guidance:\n"
-        "- Casual, witty, meme-native; playful sarcasm is ok when appropriate.\n"
-        "- Immediate-action focus: strong 1-3s hook, product/demo visible within 3-5s, direct CTA.\n"
-        "- Visual cues: UGC/creator-led, reaction close-ups, jump cuts, text overlays, fast pacing, 9:16 aspect ratio.\n"
-        "- Keep language short, conversational, and punchy — avoid corporate phrasing.\n\n"
-        "Output requirements (MUST follow exactly):\n"
-        "Return ONLY a single valid JSON object using this exact schema with one idea in the ideas array. No extra text.\n"
-        "{\n"
-        "  \"ideas\": [\n"
-        "    {\n"
-        "      \"format\": \"Reel/TikTok (9:16)\",\n"
-        "      \"title\": \"Short catchy title\",\n"
-        "      \"caption\": \"One-line hook (<=8 words)\",\n"
-        "      \"script\": \"Hook: ...\\nProblem: ...\\nSolution: ...\\nCTA: ...\",\n"
-        "      \"scriptFull\": \"Shot-by-shot with timings (e.g., 0-3s hook; 3-8s demo; 8-12s CTA)\",\n"
-        "      \"editingNotes\": [\"jump cuts\", \"face close-ups\", \"text overlay suggestions\"],\n"
-        "      \"tone\": \"casual/witty/energetic\",\n"
-        "      \"duration\": \"15s/30s/45s\",\n"
-        "      \"apps\": [\"CapCut\", \"InShot\"]\n"
-        "    }\n"
-        "  ]\n"
-        "}\n\n"
-        "Additional rules:\n"
-        "1) Keep hooks visceral and attention-grabbing (reaction, surprising visual, or audio jump).\n"
-        "2) Editing notes must include at least 2 concrete actionable tips (cuts, overlays, pacing, audio).\n"
-        "3) Prioritize 15-30s Reels for younger audiences; allow 45-60s only if there is a clear storytelling reason.\n"
-        "4) No prose outside the JSON object; do not include examples, explanations, or comments.\n"
-        "5) No trailing commas or JSON comments.\n"
-    )
-    
-    user = f"""Generate ONE short-form video idea for this business:
-
-{business_description}
-
-Requirements:
-1. Strong hook in first 3 seconds
-2. Clear problem-solution structure
-3. Keep it under 60 seconds
-4. Focus on key benefits
-5. End with clear call-to-action
-
-Format as clean JSON exactly matching the structure shown."""
+    if not claude_breaker.allow():
+        metrics.inc('claude_errors_total', kind='ideas', error='circuit_open')
+        raise CircuitOpenError(claude_breaker.describe())
+        
+    endpoint = 'batch' if priority == PRIORITY_BATCH else 'ideas'
+    model, max_tokens = model_router.pick(endpoint, 'ideas', business_description)
+    params = build_idea_request(business_description, angle, model, max_tokens)
+    deadline_at = time.time() + timeout
     
     try:
-        start = time.time()
-        message = claude.messages.create(
-            model=CLAUDE_MODEL,
-            max_tokens=2000,
-            temperature=0.7,
-            system=system,
-            messages=[
-                {"role": "user", "content": user}
-            ]
-        )
-        
-        if time.time() - start > timeout:
-            raise RuntimeError(f"Claude API call timed out after {timeout}s")
-            
-        # Claude-3 returns content as a list of content blocks
-        text = message.content[0].text.strip()
-        print("\n=== Raw Claude response ===\n", text, "\n===========================\n")  # More visible debug log
-        
-        # Clean and extract JSON
-        text = text.strip()
-        if not text.startswith('{'):
-            print("WARNING: Response doesn't start with '{'. Raw response:", text)
-            json_start = text.find('{')
-            if json_start >= 0:
-                text = text[json_start:]
-            else:
-                raise ValueError("No JSON object found in response")
-                
-        if not text.endswith('}'):
-            json_end = text.rfind('}')
-            if json_end >= 0:
-                text = text[:json_end + 1]
-            else:
-                raise ValueError("No complete JSON object found")
-                
-        # Validate it's a single JSON object
-        if text.count('{') != text.count('}'):
-            raise ValueError("Mismatched braces in JSON")
-            
-        print("Extracted JSON:", text)  # Debug log
-        
+        message, latency, usage = _create_ideas_message(params, priority, timeout)
         try:
-            data = json.loads(text)
-        except json.JSONDecodeError as e:
-            print("JSON parse error. Response:", text)  # Debug log full response
-            raise ValueError(f"Invalid JSON: {str(e)}")
-            
-        if not isinstance(data, dict) or 'ideas' not in data:
-            raise ValueError("Response missing 'ideas' array")
-            
-        ideas = data['ideas']
-        if not isinstance(ideas, list):
-            raise ValueError("'ideas' must be an array")
-        print("Parsed ideas:", json.dumps(ideas, indent=2))  # Debug log
-        
-        if not isinstance(ideas, list):
-            raise ValueError("Invalid response format - expected ideas array")
-            
-        # Validate and clean each idea
-        clean_ideas = []
-        for idea in ideas[:max_ideas]:
-            if not isinstance(idea, dict):
-                continue
-            # Required fields
-            required_fields = ['format', 'title', 'caption', 'script', 'scriptFull', 'tone', 'duration', 'apps']
-            missing_fields = [f for f in required_fields if f not in idea]
-            if missing_fields:
-                raise ValueError(f"Idea missing required fields: {', '.join(missing_fields)}")
-            
-            # Validate required fields and types
-            if not isinstance(idea.get('apps', []), list):
-                raise ValueError("'apps' field must be an array")
-
-            # Generate editing notes from scriptFull if not provided
-            editing_notes = []
-            if "time-lapse" in idea['scriptFull'].lower():
-                editing_notes.append("Create time-lapse sequence")
-            if "transition" in idea['scriptFull'].lower():
-                editing_notes.append("Add smooth transitions between scenes")
-            if "montage" in idea['scriptFull'].lower():
-                editing_notes.append("Fast-paced editing for montage")
-            if "CTA" in idea['scriptFull']:
-                editing_notes.append("Add text overlay for call-to-action")
-            editing_notes.append("Use upbeat background music")
-            editing_notes.append("Add on-screen text for key points")
-
-            # Clean and validate the idea
-            clean_idea = {
-                'format': str(idea['format'])[:100],
-                'title': str(idea['title'])[:200],
-                'caption': str(idea['caption'])[:1000],
-                'script': str(idea['script'])[:1000],
-                'scriptFull': str(idea['scriptFull'])[:2000],
-                'editingNotes': editing_notes,
-                'tone': str(idea['tone'])[:50],
-                'duration': str(idea['duration'])[:20],
-                'apps': [str(x)[:100] for x in idea['apps']][:5]
-            }
-            
-            # Verify all fields have content
-            empty_fields = [k for k, v in clean_idea.items() if not v]
-            if empty_fields:
-                raise ValueError(f"Empty required fields: {', '.join(empty_fields)}")
-                
-            clean_ideas.append(clean_idea)
-            
-        return clean_ideas
+            # Claude-3 returns content as a list of content blocks
+            ideas = parse_ideas_response(message.content[0].text.strip(), max_ideas)
+        except ValueError:
+            remaining = deadline_at - time.time()
+            params = model_router.escalate(params, 'ideas', getattr(message, 'stop_reason', None) == 'max_tokens',
+                                           remaining, latency)
+            if params is None:
+                raise
+            message, latency, usage = _create_ideas_message(params, priority, remaining)
+            ideas = parse_ideas_response(message.content[0].text.strip(), max_ideas)
+        store_ideas(business_description, ideas, 'claude', model=params['model'], latency=latency, usage=usage)
+        return ideas
         
+    except ClaudeOverloadedError:
+        raise
     except Exception as e:
-        raise RuntimeError(f"Claude API error: {str(e)}")
+        raise RuntimeError(f"Claude API error: {str(e)}") from e
 
 
-def call_claude_followup(idea: Dict[str, Any], question: str, timeout: int = 20) -> str:
-    """Ask Claude a follow-up question about a specific idea (editing, timing, assets).
+def _create_ideas_message(params: Dict[str, Any], priority: int, timeout: float) -> Tuple[Any, float, Dict[str, int]]:
+    """One scheduled ``messages.create`` for an idea request.
 
-    Returns a plain-text reply focusing on practical editing instructions and suggestions.
+    ``timeout`` covers the queue wait and the API call together: the call
+    only gets what is left after waiting for a slot. The client makes no
+    retries of its own, so the SDK timeout is a bound on the whole call.
+
+    Returns:
+        Tuple of (message, API latency in seconds, ``record_usage`` counts)
+    """
+    deadline_at = time.time() + timeout
+    with claude_scheduler.slot('ideas', priority, request_tokens(params), timeout) as settle:
+        started = time.time()
+        if started >= deadline_at:
+            raise TimeoutError(f"Queued past the {timeout:g}s deadline")
+        try:
+            with metrics.timer('api_wait'):
+                message = claude.messages.create(**params, timeout=deadline_at - started)
+        except Exception as e:
+            claude_breaker.record(False, time.time() - started)
+            error = _api_error_class(e)
+            metrics.inc('claude_errors_total', kind='ideas', error=error)
+            if error == 'rate_limited':
+                claude_scheduler.throttle()
+            raise
+        latency = time.time() - started
+        claude_breaker.record(True, latency)
+        usage = record_usage('ideas', message)
+        settle(usage)
+        model_router.observe('ideas', params['model'], usage, latency)
+        return message, latency, usage
+
+
+def call_claude_for_ideas_stream(business_description: str, max_ideas: int = 1,
+                                 priority: int = PRIORITY_INTERACTIVE,
+                                 timeout: float = IDEA_DEADLINE) -> Iterator[Tuple[str, Any]]:
+    """Stream a Claude idea generation, yielding fields as they complete.
+
+    Yields ``('field', {'index', 'field', 'value'})`` for each idea field as
+    soon as the model closes it, then a single ``('ideas', clean_ideas)``
+    once the full response has passed the same validation as
+    ``call_claude_for_ideas``. Streamed values are truncated to the same
+    limits but are provisional; the final ideas are authoritative. The model
+    is routed against the 'stream' latency target; since fields have already
+    been sent there is no escalation retry, so the full max_tokens is kept.
+
+    ``timeout`` covers the whole call, queue wait included. The HTTP client
+    only times out a single read, so the deadline is also checked between
+    chunks; a stream that is still trickling when it passes is abandoned.
+
+    Raises:
+        RuntimeError: If Claude is not configured or API call fails
+        CircuitOpenError: If the Claude circuit breaker is open
+        ClaudeOverloadedError: If the scheduler sheds the call
     """
     if not anthropic or not claude:
-        # Simple local fallback
-        return (
-            "I don't have access to the AI right now. "
-            "Quick tip: use jump cuts for pacing, keep hooks under 3s, add text overlays for CTAs, "
-            "and choose upbeat royalty-free music. If you need a step-by-step edit, ask me what part to expand."
-        )
+        raise RuntimeError("Claude API not configured - set ANTHROPIC_API_KEY")
+    if not claude_breaker.allow():
+        metrics.inc('claude_errors_total', kind='ideas', error='circuit_open')
+        raise CircuitOpenError(claude_breaker.describe())
 
-    # Build a concise system prompt that includes the idea context
-    idea_json = json.dumps(idea, ensure_ascii=False)
-    system = (
+    model, _ = model_router.pick('stream', 'ideas', business_description)
+    params = build_idea_request(business_description, model=model)
+    scanner = IdeaFieldStream()
+
+    deadline_at = time.time() + timeout
+    with claude_scheduler.slot('ideas', priority, request_tokens(params), timeout) as settle:
+        started = time.time()
+        if started >= deadline_at:
+            raise RuntimeError(f"Claude API error: queued past the {timeout:g}s deadline")
+        try:
+            try:
+                with claude.messages.stream(**params, timeout=deadline_at - started) as stream:
+                    for chunk in stream.text_stream:
+                        if time.time() > deadline_at:
+                            raise TimeoutError(f"Stream still running after the {timeout:g}s deadline")
+                        for index, field, value in scanner.feed(chunk):
+                            if index >= max_ideas or field not in IDEA_REQUIRED_FIELDS:
+                                continue
+                            if field in IDEA_FIELD_LIMITS:
+                                value = str(value)[:IDEA_FIELD_LIMITS[field]]
+                            elif field == 'apps' and isinstance(value, list):
+                                value = [str(x)[:100] for x in value][:5]
+                            yield 'field', {'index': index, 'field': field, 'value': value}
+                    final = stream.get_final_message()
+            except Exception as e:
+                claude_breaker.record(False, time.time() - started)
+                error = _api_error_class(e)
+                metrics.inc('claude_errors_total', kind='ideas', error=error)
+                if error == 'rate_limited':
+                    claude_scheduler.throttle()
+                raise
+            latency = time.time() - started
+            claude_breaker.record(True, latency)
+            metrics.observe('idea_stage_seconds', latency, stage='api_wait')
+            usage = record_usage('ideas', final)
+            settle(usage)
+            model_router.observe('ideas', params['model'], usage, latency)
+
+            ideas = parse_ideas_response(scanner.buffer.strip(), max_ideas)
+            store_ideas(business_description, ideas, 'claude', model=params['model'], latency=latency, usage=usage)
+        except Exception as e:
+            raise RuntimeError(f"Claude API error: {str(e)}") from e
+    yield 'ideas', ideas
+
+
+_fanout_pool = ThreadPoolExecutor(max_workers=IDEA_FANOUT_WORKERS, thread_name_prefix='idea-fanout')
+
+# Separate from the fan-out pool so hedged calls that nobody waits for any
+# more can't queue ahead of multi-idea requests. The semaphore counts calls
+# submitted and not yet finished, so a full pool is seen before submitting.
+_hedge_pool = ThreadPoolExecutor(max_workers=max(1, CLAUDE_HEDGE_WORKERS), thread_name_prefix='claude-hedge')
+_hedge_slots = threading.BoundedSemaphore(max(1, CLAUDE_HEDGE_WORKERS))
+
+
+def _submit_hedged(fn: Callable):
+    """Run ``fn`` on the hedge pool, or return None if every hedge thread is busy."""
+    if not _hedge_slots.acquire(blocking=False):
+        metrics.inc('claude_hedge_skipped_total')
+        return None
+    future = submit_in_context(_hedge_pool, fn)
+    future.add_done_callback(lambda _: _hedge_slots.release())
+    return future
+
+
+def _call_claude_before(business_description: str, angle: Optional[str], deadline_at: float) -> List[Dict[str, Any]]:
+    """Run one single-idea request with whatever is left of the deadline."""
+    remaining = deadline_at - time.time()
+    if remaining <= 0:
+        raise RuntimeError("Deadline passed before the request started")
+    return call_claude_for_ideas(business_description, 1, timeout=remaining, angle=angle)
+
+
+def generate_ideas_parallel(business_description: str, count: int,
+                            timeout: float = IDEA_DEADLINE) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Fan ``count`` single-idea Claude requests out over the shared pool.
+
+    All requests share one deadline: each is started with the time that is
+    left, and this function returns as soon as the deadline passes even if
+    some requests are still running. Ideas come back in submission order.
+
+    Returns:
+        Tuple of (ideas that finished in time, error messages for the rest)
+
+    Raises:
+        ClaudeOverloadedError: If no idea finished because the scheduler
+            shed the requests
+    """
+    deadline_at = time.time() + timeout
+    futures = [
+        submit_in_context(_fanout_pool, _call_claude_before, business_description,
+                          IDEA_ANGLES[i % len(IDEA_ANGLES)], deadline_at)
+        for i in range(count)
+    ]
+    done, not_done = wait(futures, timeout=timeout)
+    for future in not_done:
+        future.cancel()
+
+    ideas = []
+    errors = []
+    shed = None
+    for future in futures:
+        if future not in done:
+            errors.append(f"Missed the {timeout:g}s deadline")
+        elif future.exception() is not None:
+            errors.append(str(future.exception()))
+            if isinstance(future.exception(), ClaudeOverloadedError):
+                shed = future.exception()
+        else:
+            ideas.extend(future.result())
+    if shed is not None and not ideas:
+        raise shed
+    return ideas, errors
+
+
+FOLLOWUP_UNAVAILABLE_REPLY = (
+    "I don't have access to the AI right now. "
+    "Quick tip: use jump cuts for pacing, keep hooks under 3s, add text overlays for CTAs, "
+    "and choose upbeat royalty-free music. If you need a step-by-step edit, ask me what part to expand."
+)
+FOLLOWUP_ERROR_REPLY = "Sorry — I couldn't reach the AI right now. Try again in a moment."
+
+
+# Static follow-up instructions, built once at import and sent as a cacheable
+# system prefix ahead of the per-idea context.
+FOLLOWUP_SYSTEM_BLOCK = {
+    "type": "text",
+    "text": (
         "You are an expert video editor and social media strategist. "
         "A user will ask follow-up questions about a specific video idea. "
         "Always give practical, actionable, and concise editing guidance (timings, cut type, overlays, b-roll, audio cues).\n"
         "Context idea JSON follows. Use it to reference specifics but DO NOT output the full JSON again.\n"
-        f"IDEA_CONTEXT: {idea_json}\n"
-    )
+    ),
+    "cache_control": {"type": "ephemeral"},
+}
 
-    try:
-        message = claude.messages.create(
-            model=CLAUDE_MODEL,
-            max_tokens=800,
-            temperature=0.3,
-            system=system,
-            messages=[{"role": "user", "content": question}]
-        )
-        text = message.content[0].text.strip()
-        return text
-    except Exception as e:
-        print("Claude followup error:", str(e))
-        return "Sorry — I couldn't reach the AI right now. Try again in a moment."
+
+def call_claude_followup(idea: Dict[str, Any], question: str, timeout: int = 20,
+                         history: Optional[List[Dict[str, str]]] = None, summary: str = '') -> str:
+    """Ask Claude a follow-up question about a specific idea (editing, timing, assets).
+
+    ``history`` holds earlier ``user``/``assistant`` turns for the same idea
+    and ``summary`` a short note about turns that were trimmed from it.
+
+    Returns a plain-text reply focusing on practical editing instructions and suggestions.
+    Raises ClaudeOverloadedError if the scheduler sheds the call.
+    """
+    if not anthropic or not claude:
+        # Simple local fallback
+        return FOLLOWUP_UNAVAILABLE_REPLY
+    if not claude_breaker.allow():
+        metrics.inc('claude_errors_total', kind='followup', error='circuit_open')
+        return FOLLOWUP_UNAVAILABLE_REPLY
+
+    # Static instructions first, then the idea context. Once a conversation
+    # has history the idea block is cached too, since it repeats every turn.
+    idea_json = json.dumps(idea, ensure_ascii=False)
+    idea_block = {"type": "text", "text": f"IDEA_CONTEXT: {idea_json}\n"}
+    if history:
+        idea_block["cache_control"] = {"type": "ephemeral"}
+    system = [FOLLOWUP_SYSTEM_BLOCK, idea_block]
+    if summary:
+        system.append({"type": "text", "text": f"EARLIER_QUESTIONS (older turns, answers omitted): {summary}\n"})
+
+    model, max_tokens = model_router.pick('followup', 'followup', question)
+    params = {
+        'model': model,
+        'max_tokens': max_tokens,
+        'temperature': 0.3,
+        'system': system,
+        'messages': list(history or []) + [{"role": "user", "content": question}],
+    }
+    deadline_at = time.time() + timeout
+    with claude_scheduler.slot('followup', PRIORITY_CHAT, request_tokens(params), timeout) as settle:
+        started = time.time()
+        if started >= deadline_at:
+            app.logger.warning("Claude followup queued past the %gs deadline", timeout)
+            return FOLLOWUP_ERROR_REPLY
+        try:
+            with metrics.timer('followup_api_wait'):
+                message = claude.messages.create(**params, timeout=deadline_at - started)
+        except Exception as e:
+            claude_breaker.record(False, time.time() - started)
+            error = _api_error_class(e)
+            metrics.inc('claude_errors_total', kind='followup', error=error)
+            if error == 'rate_limited':
+                claude_scheduler.throttle()
+            app.logger.warning("Claude followup error: %s", e)
+            return FOLLOWUP_ERROR_REPLY
+        latency = time.time() - started
+        claude_breaker.record(True, latency)
+        usage = record_usage('followup', message)
+        settle(usage)
+        model_router.observe('followup', model, usage, latency)
+        try:
+            return message.content[0].text.strip()
+        except (IndexError, AttributeError) as e:
+            app.logger.warning("Claude followup returned no text: %s", e)
+            return FOLLOWUP_ERROR_REPLY
 
 
+@metrics.timer('fallback')
 def generate_marketing_ideas(business_description, max_ideas=6):
     """Generate a small list of content-marketing ideas from a business description.
     
@@ -244,6 +1010,7 @@ def generate_marketing_ideas(business_description, max_ideas=6):
     
     Returns a list of idea dicts with keys: type, title, description, example.
     """
+    started = time.time()
     desc = (business_description or '').strip()
     short = (desc[:120] + '...') if len(desc) > 120 else desc
 
@@ -310,72 +1077,1798 @@ def generate_marketing_ideas(business_description, max_ideas=6):
     })
 
     # Trim to max_ideas
-    return ideas[:max_ideas]
+    ideas = ideas[:max_ideas]
+    store_ideas(desc, ideas, 'local', latency=time.time() - started)
+    return ideas
 
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+class _Flight:
+    """A generation in progress that other callers can wait on."""
 
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
 
-@app.route('/content-catalyst', methods=['POST'])
-def content_catalyst():
-    """Endpoint that behaves like a small chatbot: accepts a business idea and
-    returns content-marketing ideas."""
-    data = request.get_json() or {}
-    # Accept either 'idea' or 'description' or 'text'
-    business_description = data.get('idea') or data.get('description') or data.get('text') or ''
 
-    if not business_description.strip():
-        return jsonify({'status': 'error', 'message': 'Please provide a business idea/description.'}), 400
+class GenerationCache:
+    """Bounded LRU/TTL cache for generated ideas with single-flight dedup.
+
+    Values are stored JSON-encoded, which gives a cheap size estimate for the
+    memory cap and hands every caller its own copy. Entries are evicted when
+    they expire, when there are more than ``max_entries`` of them, or when
+    their combined size exceeds ``max_bytes``. Concurrent callers asking for
+    a key that is already being generated wait for that call instead of
+    starting their own.
+    """
+
+    def __init__(self, max_entries: int, ttl: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Tuple[float, str]]' = OrderedDict()
+        self._inflight: Dict[str, _Flight] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Plain lookup without single-flight; counts as a hit or a miss."""
+        with self._lock:
+            value = self._get_locked(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def contains(self, key: str) -> bool:
+        """Whether ``key`` has a live entry or is being generated; not counted."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return key in self._inflight or (entry is not None and entry[0] >= time.time())
+
+    def put(self, key: str, value: Any) -> None:
+        if not value or self.max_entries <= 0:
+            return
+        encoded = json.dumps(value, ensure_ascii=False)
+        if len(encoded) > self.max_bytes:
+            return
+        with self._lock:
+            self._drop_locked(key)
+            self._entries[key] = (time.time() + self.ttl, encoded)
+            self._bytes += len(encoded)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._drop_locked(oldest)
+                self.evictions += 1
+
+    def get_or_generate(self, key: str, generate: Callable[[], Any]) -> Tuple[Any, str]:
+        """Return ``(value, status)`` for ``key``, calling ``generate`` on a miss.
+
+        ``status`` is ``'hit'``, ``'miss'`` (this caller ran ``generate``) or
+        ``'coalesced'`` (this caller waited on another caller's generation).
+        Errors from ``generate`` are raised in every waiting caller and are
+        never cached.
+        """
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self.hits += 1
+                return value, 'hit'
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return json.loads(json.dumps(flight.value)), 'coalesced'
 
-    # Try Claude first, fallback to local generator
-    ideas = None
-    error = None
-    
-    if ANTHROPIC_API_KEY and claude:
         try:
-            ideas = call_claude_for_ideas(business_description)
-        except Exception as e:
-            error = str(e)
-            print(f"Claude generation failed, falling back to local: {error}")
-    
-    # Fallback to deterministic generator
-    if not ideas:
-        ideas = generate_marketing_ideas(business_description)
-        
-    response = {
-        'status': 'success',
-        'input': business_description,
-        'ideas': ideas,
-        'source': 'claude' if ideas and not error else 'local'
-    }
-    if error:
-        response['error'] = error
-        
-    return jsonify(response)
+            value = generate()
+            flight.value = value
+            self.put(key, value)
+            return value, 'miss'
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
 
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxEntries': self.max_entries,
+                'maxBytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'inflight': len(self._inflight),
+                'hitRate': round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
 
-@app.route('/idea-chat', methods=['POST'])
-def idea_chat():
-    """Handle follow-up chat about a specific idea.
+    def _get_locked(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, encoded = entry
+        if expires_at < time.time():
+            self._drop_locked(key)
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return json.loads(encoded)
+
+    def _drop_locked(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+
+def idea_cache_key(business_description: str, model: str = IDEA_ROUTED_MODELS,
+                   prompt_version: str = IDEA_PROMPT_VERSION) -> str:
+    """Build a cache key from the normalized description, model and prompt version.
 
-    Expects JSON: { "idea": { ... }, "question": "..." }
-    Returns JSON: { status: 'success', reply: 'text' }
+    Normalization lower-cases and collapses whitespace so trivially different
+    submissions of the same description share an entry.
     """
-    data = request.get_json() or {}
-    idea = data.get('idea')
-    question = data.get('question', '').strip()
+    normalized = ' '.join((business_description or '').lower().split())
+    raw = '\x00'.join([model, prompt_version, normalized])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
 
-    if not idea or not isinstance(idea, dict) or not question:
-        return jsonify({'status': 'error', 'message': 'Provide an idea object and a non-empty question.'}), 400
 
-    try:
-        reply = call_claude_followup(idea, question)
-    except Exception as e:
-        reply = str(e)
+idea_cache = GenerationCache(IDEA_CACHE_MAX_ENTRIES, IDEA_CACHE_TTL, IDEA_CACHE_MAX_BYTES)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling Claude while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker for outbound Claude calls.
+
+    Keeps the outcome and latency of every call from the last ``window``
+    seconds. Once there are at least ``min_calls`` of them and the share of
+    failures (errors, or calls slower than ``slow_call``) reaches
+    ``error_rate``, the breaker opens and callers fall back immediately. After
+    ``cooldown`` seconds it goes half-open and lets ``probes`` calls through:
+    a success closes it again, a failure re-opens it.
+    """
+
+    def __init__(self, window: float, min_calls: int, error_rate: float, slow_call: float,
+                 cooldown: float, probes: int):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.cooldown = cooldown
+        self.probes = probes
+        self.state = 'closed'
+        self._calls: deque = deque()  # (finished_at, ok, latency)
+        self._opened_at = 0.0
+        self._probes_inflight = 0
+        self._last_probe_at = 0.0
+        self._lock = threading.Lock()
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """Whether a Claude call may go ahead right now."""
+        with self._lock:
+            now = time.time()
+            if self.state == 'open' and now - self._opened_at >= self.cooldown:
+                self.state = 'half_open'
+                self._probes_inflight = 0
+            if self.state == 'closed':
+                return True
+            # A probe that never reported back (e.g. an abandoned stream)
+            # must not wedge the breaker half-open forever.
+            if self.state == 'half_open' and (self._probes_inflight < self.probes
+                                              or now - self._last_probe_at > self.cooldown):
+                self._probes_inflight += 1
+                self._last_probe_at = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok: bool, latency: float) -> None:
+        """Record the outcome of a call that ``allow`` let through."""
+        ok = ok and latency <= self.slow_call
+        with self._lock:
+            now = time.time()
+            self._calls.append((now, ok, latency))
+            self._prune_locked(now)
+            if self.state == 'half_open':
+                self._probes_inflight = max(0, self._probes_inflight - 1)
+                if ok:
+                    self.state = 'closed'
+                    self._calls.clear()
+                else:
+                    self._open_locked(now)
+            elif self.state == 'closed':
+                failures = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+                if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.error_rate:
+                    self._open_locked(now)
+
+    def describe(self) -> str:
+        """Short human-readable state, used in fallback error messages."""
+        stats = self.stats()
+        return (f"Claude circuit {stats['state']} (error rate {stats['errorRate']:.0%} over "
+                f"{stats['calls']} calls in {self.window:g}s) - using local fallback")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._prune_locked(time.time())
+            calls = list(self._calls)
+            state = self.state
+            if state == 'open' and time.time() - self._opened_at >= self.cooldown:
+                state = 'half_open'
+            latencies = sorted(latency for _, _, latency in calls)
+            failures = sum(1 for _, ok, _ in calls if not ok)
+            return {
+                'state': state,
+                'calls': len(calls),
+                'failures': failures,
+                'errorRate': round(failures / len(calls), 4) if calls else 0.0,
+                'latencyP50': _percentile(latencies, 0.50),
+                'latencyP95': _percentile(latencies, 0.95),
+                'latencyP99': _percentile(latencies, 0.99),
+                'timesOpened': self.times_opened,
+                'rejected': self.rejected,
+            }
+
+    def _open_locked(self, now: float) -> None:
+        self.state = 'open'
+        self._opened_at = now
+        self.times_opened += 1
+        app.logger.warning("Claude circuit opened: %d recent calls, cooling down %gs", len(self._calls), self.cooldown)
+
+    def _prune_locked(self, now: float) -> None:
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list, rounded to ms."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return round(sorted_values[index], 3)
+
+
+claude_breaker = CircuitBreaker(CLAUDE_BREAKER_WINDOW, CLAUDE_BREAKER_MIN_CALLS, CLAUDE_BREAKER_ERROR_RATE,
+                                CLAUDE_BREAKER_SLOW_CALL, CLAUDE_BREAKER_COOLDOWN, CLAUDE_BREAKER_PROBES)
+
+
+class ClaudeOverloadedError(RuntimeError):
+    """Raised when the scheduler sheds a Claude call instead of queueing it."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ClaudeScheduler:
+    """Admission control in front of every outbound Claude call.
+
+    At most ``max_concurrency`` calls run at once, and two continuously
+    refilled token buckets hold them to ``rpm`` requests and ``tpm`` tokens
+    per minute (0 disables a limit). A call's tokens are estimated up front
+    and corrected from ``message.usage`` once it finishes. Calls that can't
+    start yet wait in a priority queue of at most ``max_queue`` entries; when
+    it is full, a new call evicts the lowest-priority waiter if it outranks
+    it and is rejected otherwise. Waiters still queued after ``max_wait``
+    seconds (or the caller's own timeout) are rejected too.
+    """
+
+    def __init__(self, rpm: float, tpm: float, max_concurrency: int, max_queue: int, max_wait: float):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._waiting: List[list] = []  # heap of [priority, seq, tokens, evicted]
+        self._seq = 0
+        self._inflight = 0
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._refilled_at = time.monotonic()
+        self.admitted = 0
+        self.shed = 0
+
+    @contextmanager
+    def slot(self, kind: str, priority: int, tokens: int, timeout: Optional[float] = None):
+        """Hold a call slot for the duration of the ``with`` block.
+
+        Args:
+            kind: Call kind for metrics ('ideas' or 'followup')
+            priority: One of the PRIORITY_* constants
+            tokens: Estimated input plus output tokens of the call
+            timeout: Longest the caller can wait for a slot; capped at ``max_wait``
+
+        Yields:
+            ``settle(usage)``, to call with the ``record_usage`` counts so
+            the token bucket is charged for what the call actually used.
+
+        Raises:
+            ClaudeOverloadedError: If the call is shed instead of run
+        """
+        queued = self._acquire(kind, priority, tokens, timeout)
+        metrics.observe('idea_stage_seconds', queued, stage='queue_wait' if kind == 'ideas' else f'{kind}_queue_wait')
+        used = [tokens]
+
+        def settle(usage: Dict[str, int]) -> None:
+            used[0] = usage['input_tokens'] + usage['cache_creation_input_tokens'] + usage['output_tokens']
+
+        try:
+            yield settle
+        finally:
+            with self._cond:
+                self._inflight -= 1
+                self._refill_locked(time.monotonic())
+                if self.tpm:
+                    self._tokens = min(float(self.tpm), self._tokens + tokens - used[0])
+                self._cond.notify_all()
+
+    def throttle(self) -> None:
+        """Empty both buckets after the API itself answered 429, so queued
+        calls wait for them to refill instead of piling on."""
+        with self._cond:
+            self._refill_locked(time.monotonic())
+            self._requests = min(self._requests, 0.0)
+            self._tokens = min(self._tokens, 0.0)
+
+    def check_queue(self, kind: str, priority: int) -> None:
+        """Shed now if a new call at ``priority`` would be rejected for queue
+        depth, with the same metrics and ``Retry-After`` as ``slot``.
+
+        Raises:
+            ClaudeOverloadedError: If the queue is full of calls that
+                ``priority`` does not outrank
+        """
+        with self._cond:
+            if len(self._waiting) >= self.max_queue:
+                worst = max(self._waiting) if self._waiting else None
+                if worst is None or worst[0] <= priority:
+                    raise self._shed_locked(kind, priority, 'queue_full')
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            self._refill_locked(time.monotonic())
+            return {
+                'inflight': self._inflight,
+                'queued': len(self._waiting),
+                'admitted': self.admitted,
+                'shed': self.shed,
+                'rpm': self.rpm or None,
+                'tpm': self.tpm or None,
+                'requestsAvailable': round(self._requests, 2) if self.rpm else None,
+                'tokensAvailable': round(self._tokens) if self.tpm else None,
+                'maxConcurrency': self.max_concurrency,
+                'maxQueue': self.max_queue,
+            }
+
+    def _acquire(self, kind: str, priority: int, tokens: int, timeout: Optional[float]) -> float:
+        started = time.monotonic()
+        deadline = started + (self.max_wait if timeout is None else max(0.0, min(timeout, self.max_wait)))
+        with self._cond:
+            if not self._waiting and self._ready_in_locked(tokens, started) == 0:
+                self._admit_locked(tokens)
+                return 0.0
+            if len(self._waiting) >= self.max_queue:
+                worst = max(self._waiting) if self._waiting else None
+                if worst is None or worst[0] <= priority:
+                    raise self._shed_locked(kind, priority, 'queue_full')
+                worst[3] = True
+                self._waiting.remove(worst)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+            entry = [priority, self._seq, tokens, False]
+            self._seq += 1
+            heapq.heappush(self._waiting, entry)
+            while True:
+                if entry[3]:
+                    raise self._shed_locked(kind, priority, 'evicted')
+                now = time.monotonic()
+                ready_in = self._ready_in_locked(tokens, now) if self._waiting[0] is entry else None
+                if ready_in == 0:
+                    heapq.heappop(self._waiting)
+                    self._admit_locked(tokens)
+                    self._cond.notify_all()
+                    return now - started
+                if now >= deadline:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                    raise self._shed_locked(kind, priority, 'queue_timeout')
+                self._cond.wait(deadline - now if ready_in is None else min(deadline - now, ready_in))
+
+    def _admit_locked(self, tokens: int) -> None:
+        self._inflight += 1
+        self._requests -= 1
+        self._tokens -= tokens
+        self.admitted += 1
+
+    def _refill_locked(self, now: float) -> None:
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        if self.rpm:
+            self._requests = min(float(self.rpm), self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(float(self.tpm), self._tokens + elapsed * self.tpm / 60)
+
+    def _ready_in_locked(self, tokens: int, now: float) -> Optional[float]:
+        """Seconds until the buckets can admit ``tokens`` (0 = now), or None
+        while every concurrency slot is taken."""
+        if self._inflight >= self.max_concurrency:
+            return None
+        self._refill_locked(now)
+        wait_for = 0.0
+        if self.rpm and self._requests < 1:
+            wait_for = (1 - self._requests) * 60 / self.rpm
+        # A call larger than the whole bucket only needs a full bucket.
+        need = min(tokens, self.tpm)
+        if self.tpm and self._tokens < need:
+            wait_for = max(wait_for, (need - self._tokens) * 60 / self.tpm)
+        return wait_for
+
+    def _shed_locked(self, kind: str, priority: int, reason: str) -> ClaudeOverloadedError:
+        self.shed += 1
+        metrics.inc('claude_shed_total', kind=kind, priority=PRIORITY_NAMES.get(priority, priority), reason=reason)
+        # Rough time for the queue ahead of a new call to drain.
+        backlog = len(self._waiting) + self._inflight
+        if self.rpm:
+            retry_after = backlog * 60 / self.rpm
+        else:
+            retry_after = self.max_wait * backlog / max(1, self.max_concurrency)
+        retry_after = max(1, math.ceil(retry_after))
+        return ClaudeOverloadedError(
+            f"Too many Claude requests in flight ({reason.replace('_', ' ')}) - retry in {retry_after}s", retry_after)
+
+
+def request_tokens(params: Dict[str, Any]) -> int:
+    """Token estimate for a Messages API request: its prompt plus ``max_tokens``."""
+    prompt = json.dumps([params.get('system'), params.get('messages')], ensure_ascii=False)
+    return estimate_tokens(prompt) + params.get('max_tokens', 0)
+
+
+def _worker_share(limit: float) -> float:
+    """This worker's share of an account-wide per-minute limit."""
+    return limit / max(1, int(os.environ.get('WEB_CONCURRENCY', 1))) if limit else 0
+
+
+claude_scheduler = ClaudeScheduler(_worker_share(CLAUDE_RPM), _worker_share(CLAUDE_TPM), CLAUDE_MAX_CONCURRENCY,
+                                   CLAUDE_QUEUE_MAX, CLAUDE_QUEUE_TIMEOUT)
+
+
+class ModelRouter:
+    """Per-request model and ``max_tokens`` choice for Claude calls.
+
+    Requests go to ``fast`` (CLAUDE_MODEL) unless the text is complex (at
+    least ``complex_words`` words, or a multi-part brief) and ``strong`` has
+    been meeting the endpoint's latency target: its p95 over the last
+    ``window`` calls of that kind, optimistic until ``min_samples`` exist.
+    ``escalate`` retries a response that failed validation on ``strong``,
+    unless the time left is shorter than that model's median latency.
+
+    ``max_tokens`` follows the observed output size: ``headroom`` times the
+    p99 of the last ``window`` ``output_tokens`` for the call kind, clamped to
+    [``floor``, the kind's default]. Output length is up to the model, so
+    this doesn't speed calls up; it keeps runaway responses short and
+    reserves less of the scheduler's TPM budget per call. A response cut
+    off by the tighter limit is retried with the default.
+    """
+
+    DEFAULT_MAX_TOKENS = {'ideas': 2000, 'followup': 800}
+
+    def __init__(self, fast: str, strong: str, targets: Dict[str, float], complex_words: int,
+                 headroom: float = 1.3, floor: int = 256, window: int = 200, min_samples: int = 20):
+        self.fast = fast
+        self.strong = strong if strong and strong != fast else ''
+        self.targets = targets
+        self.complex_words = complex_words
+        self.headroom = headroom
+        self.floor = floor
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._outputs: Dict[str, deque] = {kind: deque(maxlen=window) for kind in self.DEFAULT_MAX_TOKENS}
+        self._latency: Dict[Tuple[str, str], deque] = {}
+        self._window = window
+
+    def is_complex(self, text: str) -> bool:
+        words = len(text.split())
+        parts = text.count('\n') + len(re.findall(r'[.;!?](?:\s|$)', text))
+        return words >= self.complex_words or parts >= 6
+
+    def pick(self, endpoint: str, kind: str, text: str) -> Tuple[str, int]:
+        """Model and ``max_tokens`` for a call of ``kind`` ('ideas' or
+        'followup') made for ``endpoint`` (a key of the latency targets)."""
+        model = self.fast
+        if self.strong and self.is_complex(text) and self._meets_target(kind, self.strong, endpoint):
+            model = self.strong
+        metrics.inc('claude_route_total', endpoint=endpoint, model=model)
+        return model, self.max_tokens(kind)
+
+    def escalate(self, params: Dict[str, Any], kind: str, truncated: bool,
+                 remaining: Optional[float] = None, last_latency: float = 0.0) -> Optional[Dict[str, Any]]:
+        """Request parameters for one retry after a response failed
+        validation, or None if there is nothing better to try or the
+        ``remaining`` seconds are unlikely to be enough for it.
+
+        The retry is expected to take the median latency of its model, or
+        ``last_latency`` (the failed call's) until there are enough samples.
+        """
+        default = self.DEFAULT_MAX_TOKENS[kind]
+        if self.strong and params['model'] != self.strong:
+            reason = 'validation'
+            retry = dict(params, model=self.strong, max_tokens=default)
+        elif truncated and params['max_tokens'] < default:
+            reason = 'truncated'
+            retry = dict(params, max_tokens=default)
+        else:
+            return None
+        if remaining is not None and remaining < self.expected_latency(kind, retry['model'], last_latency):
+            metrics.inc('claude_escalations_skipped_total', kind=kind, reason=reason)
+            app.logger.info("Not retrying %s call on %s after %s failure: only %.1fs left",
+                            kind, retry['model'], reason, remaining)
+            return None
+        metrics.inc('claude_escalations_total', kind=kind, reason=reason)
+        app.logger.info("Retrying %s call on %s (max_tokens %d) after %s failure",
+                        kind, retry['model'], retry['max_tokens'], reason)
+        return retry
+
+    def max_tokens(self, kind: str) -> int:
+        default = self.DEFAULT_MAX_TOKENS[kind]
+        with self._lock:
+            outputs = sorted(self._outputs[kind])
+        if len(outputs) < self.min_samples:
+            return default
+        return max(self.floor, min(default, math.ceil(_percentile(outputs, 0.99) * self.headroom)))
+
+    def expected_latency(self, kind: str, model: str, default: float) -> float:
+        """Median latency of recent ``kind`` calls on ``model``, or ``default``."""
+        with self._lock:
+            latencies = sorted(self._latency.get((kind, model), ()))
+        if len(latencies) < self.min_samples:
+            return default
+        return _percentile(latencies, 0.5)
+
+    def observe(self, kind: str, model: str, usage: Dict[str, int], latency: float) -> None:
+        """Record a finished call's output size and latency."""
+        with self._lock:
+            self._outputs[kind].append(usage['output_tokens'])
+            self._latency.setdefault((kind, model), deque(maxlen=self._window)).append(latency)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latency = {f"{kind}:{model}": _percentile(sorted(v), 0.95) for (kind, model), v in self._latency.items()}
+        return {
+            'fast': self.fast,
+            'strong': self.strong or None,
+            'targets': self.targets,
+            'maxTokens': {kind: self.max_tokens(kind) for kind in self.DEFAULT_MAX_TOKENS},
+            'p95Latency': {k: round(v, 3) for k, v in latency.items() if v is not None},
+        }
+
+    def _meets_target(self, kind: str, model: str, endpoint: str) -> bool:
+        target = self.targets.get(endpoint)
+        if not target:
+            return True
+        with self._lock:
+            latencies = sorted(self._latency.get((kind, model), ()))
+        if len(latencies) < self.min_samples:
+            return True
+        return _percentile(latencies, 0.95) <= target
+
+
+def _parse_latency_targets(spec: str) -> Dict[str, float]:
+    """Parse ``"ideas=8,stream=15"`` into ``{'ideas': 8.0, 'stream': 15.0}``."""
+    targets = {}
+    for part in spec.split(','):
+        name, _, value = part.partition('=')
+        if name.strip() and value.strip():
+            targets[name.strip()] = float(value)
+    return targets
+
+
+model_router = ModelRouter(CLAUDE_MODEL, CLAUDE_MODEL_STRONG, _parse_latency_targets(CLAUDE_LATENCY_TARGETS),
+                           CLAUDE_ROUTER_COMPLEX_WORDS)
+
+
+_SIMILARITY_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Words that can be added, dropped or swapped without changing which
+# business a description is about. Everything else must match.
+_SIMILARITY_FILLER = frozenset(
+    'a an the and or of for to in on at with by from my our your their its this that these those '
+    'is are be we i you it who which very really just small little some'.split())
+
+
+def _content_words(text: str) -> frozenset:
+    """Content words of ``text``, lower-cased, with simple plurals made singular."""
+    words = set()
+    for word in _SIMILARITY_TOKEN_RE.findall(text.lower()):
+        if word in _SIMILARITY_FILLER:
+            continue
+        if len(word) > 4 and word.endswith('ies'):
+            word = word[:-3] + 'y'
+        elif len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.add(word)
+    return frozenset(words)
+
+
+def _is_typo(a: str, b: str) -> bool:
+    """Whether two words of 5+ letters are one edit (insert, delete or substitute) apart."""
+    if min(len(a), len(b)) < 5 or abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i + (len(a) == len(b)):] == b[i + 1:]
+
+
+def same_business(a: str, b: str) -> bool:
+    """Whether two descriptions differ only in word order, filler words,
+    plurals or single-letter typos.
+
+    The hashed vectors are order-blind and dominated by shared words, so
+    "wallets for men" and "wallets for women", or the same bakery in Austin
+    and in Boston, score as near-duplicates. A similarity hit has to pass
+    this check too, so a swapped city, audience, product or number misses.
+    """
+    words_a, words_b = _content_words(a), _content_words(b)
+    only_a, only_b = words_a - words_b, words_b - words_a
+    if len(only_a) != len(only_b):
+        return False
+    unmatched = set(only_b)
+    for word in only_a:
+        match = next((other for other in unmatched if _is_typo(word, other)), None)
+        if match is None:
+            return False
+        unmatched.discard(match)
+    return True
+
+
+def similarity_features(text: str, dim: int) -> Any:
+    """Hashed word + character-trigram vector for ``text``, L2-normalized.
+
+    Uses signed feature hashing (crc32) so collisions cancel out on average
+    rather than always inflating similarity. Word order is ignored, which is
+    what makes reworded descriptions match; ``same_business`` then rejects
+    candidates that differ in a content word.
+    """
+    vec = np.zeros(dim, dtype=np.float32)
+    for word in _SIMILARITY_TOKEN_RE.findall(text.lower()):
+        grams = [word]
+        padded = f' {word} '
+        grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        for gram in grams:
+            h = zlib.crc32(gram.encode('utf-8'))
+            vec[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = float(np.linalg.norm(vec))
+    if norm:
+        vec /= norm
+    return vec
+
+
+class SimilarityIndex:
+    """In-memory nearest-neighbour index over previously generated ideas.
+
+    Descriptions are embedded with ``similarity_features`` into a
+    preallocated ``capacity x dim`` float32 matrix used as a ring buffer
+    (oldest entries are overwritten first). A lookup is one matrix-vector
+    product plus ``argpartition`` for the top-k; it is memory-bound, so its
+    cost scales with ``capacity * dim`` (about 10 ms at 100k x 256 on one
+    core, see bench/similarity_bench.py). Entries only match requests for
+    the same model and prompt version, and expire after ``ttl`` seconds.
+    """
+
+    def __init__(self, capacity: int, dim: int, threshold: float, ttl: int):
+        self.capacity = capacity
+        self.dim = dim
+        self.threshold = threshold
+        self.ttl = ttl
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._expires = np.zeros(capacity, dtype=np.float64)
+        self._entries: List[Optional[Tuple[str, str, str]]] = [None] * capacity  # (tag, description, ideas json)
+        self._next = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, business_description: str, ideas: List[Dict[str, Any]], tag: str) -> None:
+        if not ideas:
+            return
+        vec = similarity_features(business_description, self.dim)
+        encoded = json.dumps(ideas, ensure_ascii=False)
+        with self._lock:
+            slot = self._next
+            self._vectors[slot] = vec
+            self._expires[slot] = time.time() + self.ttl
+            self._entries[slot] = (tag, business_description, encoded)
+            self._next = (slot + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+
+    def search(self, business_description: str, tag: str, k: int = 5) -> List[Tuple[float, str, List[Dict[str, Any]]]]:
+        """Top-``k`` live entries as ``(score, description, ideas)``, best first."""
+        vec = similarity_features(business_description, self.dim)
+        with self._lock:
+            n = self._size
+            if not n:
+                return []
+            scores = self._vectors[:n] @ vec
+            scores[self._expires[:n] < time.time()] = -1.0
+            k = min(k, n)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            results = []
+            for i in top:
+                entry = self._entries[i]
+                if scores[i] < 0 or entry is None or entry[0] != tag:
+                    continue
+                results.append((float(scores[i]), entry[1], entry[2]))
+        return [(score, desc, json.loads(encoded)) for score, desc, encoded in results]
+
+    def lookup(self, business_description: str, tag: str) -> Optional[Tuple[float, str, List[Dict[str, Any]]]]:
+        """Best match at or above ``threshold`` that is also ``same_business``
+        as the query, counted as a hit or miss."""
+        for match in self.search(business_description, tag, k=5):
+            if match[0] < self.threshold:
+                break
+            if same_business(business_description, match[1]):
+                with self._lock:
+                    self.hits += 1
+                return match
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': self._size,
+                'capacity': self.capacity,
+                'dim': self.dim,
+                'threshold': self.threshold,
+                'bytes': int(self._vectors.nbytes),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+if np is not None and IDEA_SIMILAR_MAX > 0:
+    idea_similarity: Optional[SimilarityIndex] = SimilarityIndex(
+        IDEA_SIMILAR_MAX, IDEA_SIMILAR_DIM, IDEA_SIMILAR_THRESHOLD, IDEA_SIMILAR_TTL)
+else:
+    idea_similarity = None
+
+
+def similarity_tag(model: str = IDEA_ROUTED_MODELS, prompt_version: str = IDEA_PROMPT_VERSION) -> str:
+    """Similar ideas are only reused for the same models and prompt version."""
+    return f"{model}\x00{prompt_version}"
+
+
+def find_similar_ideas(business_description: str) -> Optional[Tuple[float, str, List[Dict[str, Any]]]]:
+    """Stored ideas for a near-duplicate description, or None."""
+    if idea_similarity is None:
+        return None
+    with metrics.timer('similarity_lookup'):
+        return idea_similarity.lookup(business_description, similarity_tag())
+
+
+def _generate_and_index(business_description: str, priority: int = PRIORITY_INTERACTIVE) -> List[Dict[str, Any]]:
+    """Claude generation that also feeds the similarity index."""
+    ideas = call_claude_for_ideas(business_description, timeout=IDEA_DEADLINE, priority=priority)
+    if idea_similarity is not None:
+        idea_similarity.add(business_description, ideas, similarity_tag())
+    return ideas
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for history budgets."""
+    return len(text) // 4 + 1
+
+
+class IdeaSessionStore:
+    """Server-side follow-up chat sessions keyed by idea ID.
+
+    Each session keeps the idea plus a compact conversation history. When the
+    history goes over ``history_tokens`` the oldest turns are dropped and
+    their questions folded into a short ``summary`` so the model still knows
+    what was already covered. Sessions are evicted LRU-first when they expire,
+    when there are more than ``max_sessions``, or when their combined size
+    exceeds ``max_bytes``.
+    """
+
+    def __init__(self, max_sessions: int, ttl: int, max_bytes: int, history_tokens: int):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.history_tokens = history_tokens
+        self._sessions: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def create(self, idea: Dict[str, Any]) -> str:
+        """Start a session for ``idea`` and return its new ID."""
+        idea_id = uuid.uuid4().hex[:16]
+        session = {
+            'idea': {k: v for k, v in idea.items() if k != 'id'},
+            'history': [],
+            'summary': '',
+            'expires_at': time.time() + self.ttl,
+        }
+        session['bytes'] = self._size(session)
+        with self._lock:
+            self._sessions[idea_id] = session
+            self._bytes += session['bytes']
+            self._evict_locked()
+        return idea_id
+
+    def get(self, idea_id: str) -> Optional[Dict[str, Any]]:
+        """Return a snapshot ``{idea, history, summary}`` or None if unknown/expired."""
+        with self._lock:
+            session = self._touch_locked(idea_id)
+            if session is None:
+                return None
+            return {
+                'idea': session['idea'],
+                'history': list(session['history']),
+                'summary': session['summary'],
+            }
+
+    def add_turn(self, idea_id: str, question: str, reply: str) -> None:
+        """Append a question/reply pair, trimming old turns to the token budget."""
+        with self._lock:
+            session = self._touch_locked(idea_id)
+            if session is None:
+                return
+            history = session['history']
+            history.append({'role': 'user', 'content': question})
+            history.append({'role': 'assistant', 'content': reply})
+            while history and sum(estimate_tokens(t['content']) for t in history) > self.history_tokens:
+                dropped = history.pop(0)['content']
+                history.pop(0)
+                summary = f"{session['summary']} | {dropped[:120]}" if session['summary'] else dropped[:120]
+                session['summary'] = summary[-IDEA_CHAT_SUMMARY_CHARS:]
+            self._bytes -= session['bytes']
+            session['bytes'] = self._size(session)
+            self._bytes += session['bytes']
+            self._evict_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'bytes': self._bytes,
+                'maxSessions': self.max_sessions,
+                'maxBytes': self.max_bytes,
+                'ttl': self.ttl,
+                'evictions': self.evictions,
+            }
+
+    @staticmethod
+    def _size(session: Dict[str, Any]) -> int:
+        return (len(json.dumps(session['idea'], ensure_ascii=False)) + len(session['summary'])
+                + sum(len(t['content']) for t in session['history']))
+
+    def _touch_locked(self, idea_id: str) -> Optional[Dict[str, Any]]:
+        session = self._sessions.get(idea_id)
+        if session is None:
+            return None
+        now = time.time()
+        if session['expires_at'] < now:
+            self._bytes -= self._sessions.pop(idea_id)['bytes']
+            self.evictions += 1
+            return None
+        session['expires_at'] = now + self.ttl
+        self._sessions.move_to_end(idea_id)
+        return session
+
+    def _evict_locked(self) -> None:
+        while self._sessions and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+            _, session = self._sessions.popitem(last=False)
+            self._bytes -= session['bytes']
+            self.evictions += 1
+
+
+class UsageStats:
+    """Running token usage per kind of Claude call, from ``message.usage``.
+
+    Tracks prompt-cache reads and writes next to plain input/output tokens so
+    the effect of the cached system prefixes can be checked in production.
+    """
+
+    FIELDS = ['input_tokens', 'output_tokens', 'cache_read_input_tokens', 'cache_creation_input_tokens']
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, int]] = {}
+
+    def record(self, kind: str, usage: Any) -> Dict[str, int]:
+        counts = {f: int(getattr(usage, f, 0) or 0) for f in self.FIELDS}
+        for f, n in counts.items():
+            if n:
+                metrics.inc('claude_tokens_total', n, kind=kind, type=f.replace('_input_tokens', '').replace('_tokens', ''))
+        with self._lock:
+            totals = self._totals.setdefault(kind, dict.fromkeys(['requests'] + self.FIELDS, 0))
+            totals['requests'] += 1
+            for f in self.FIELDS:
+                totals[f] += counts[f]
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {}
+            for kind, t in self._totals.items():
+                prompt = t['input_tokens'] + t['cache_read_input_tokens'] + t['cache_creation_input_tokens']
+                out[kind] = {
+                    'requests': t['requests'],
+                    'inputTokens': t['input_tokens'],
+                    'outputTokens': t['output_tokens'],
+                    'cacheReadTokens': t['cache_read_input_tokens'],
+                    'cacheWriteTokens': t['cache_creation_input_tokens'],
+                    'cacheReadRatio': round(t['cache_read_input_tokens'] / prompt, 4) if prompt else 0.0,
+                }
+            return out
+
+
+usage_stats = UsageStats()
+
+
+def record_usage(kind: str, message: Any) -> Dict[str, int]:
+    """Record token usage of a Claude response under ``kind``."""
+    return usage_stats.record(kind, getattr(message, 'usage', None))
+
+
+idea_sessions = IdeaSessionStore(IDEA_SESSION_MAX, IDEA_SESSION_TTL, IDEA_SESSION_MAX_BYTES, IDEA_CHAT_HISTORY_TOKENS)
+
+
+def register_ideas(ideas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Give each idea a server-side ``id`` backed by a follow-up chat session."""
+    for idea in ideas:
+        idea['id'] = idea_sessions.create(idea)
+    return ideas
+
+
+def gevent_patched(module: str) -> bool:
+    """Whether gevent has monkey-patched ``module`` (i.e. we run under the gevent worker)."""
+    return gevent_monkey is not None and gevent_monkey.is_module_patched(module)
+
+
+def run_blocking(fn: Callable, *args: Any) -> Any:
+    """Call ``fn(*args)`` on a real OS thread when gevent has patched threading.
+
+    Under the gevent worker a ``threading.Thread`` is a greenlet, so blocking
+    C calls such as sqlite3 would stall every request in the worker. The hub
+    threadpool runs them off the event loop while the calling greenlet waits.
+    Without gevent this is a plain call.
+    """
+    if gevent_patched('threading'):
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+
+class IdeaStore:
+    """Persistent SQLite store of every generated idea, shared by all workers.
+
+    The database runs in WAL mode so gunicorn workers can read while one of
+    them writes. ``record`` only enqueues; a background thread drains the
+    queue in batched transactions, so the request path never waits on disk.
+    Under gevent that thread is a greenlet, so its sqlite3 calls (including
+    waiting on another worker's write lock) go through ``run_blocking``.
+    If the queue is full, rows are dropped and counted rather than blocking.
+    An FTS5 table over the input, title and script text backs ``search``;
+    listings use keyset pagination on the row id (newest first).
+
+    Every row carries an ``owner`` (a hash of the client token of the
+    request that generated it) and reads are always filtered by it, so one
+    client never sees another's descriptions. Rows without an owner (bulk
+    runs, rows from before the column existed) are never listed.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS ideas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL NOT NULL,
+            input TEXT NOT NULL,
+            input_key TEXT NOT NULL,
+            source TEXT NOT NULL,
+            model TEXT,
+            latency_ms REAL,
+            input_tokens INTEGER,
+            output_tokens INTEGER,
+            idea TEXT NOT NULL,
+            owner TEXT
+        );
+        CREATE INDEX IF NOT EXISTS ideas_input_key ON ideas (input_key, id);
+        CREATE VIRTUAL TABLE IF NOT EXISTS ideas_fts USING fts5(input, title, body);
+    """
+
+    def __init__(self, path: str, queue_size: int = 10000, batch_size: int = 200):
+        self.path = path
+        self.batch_size = batch_size
+        self._queue: 'queue.Queue[Optional[Tuple]]' = queue.Queue(maxsize=queue_size)
+        self._local = threading.local()
+        self._start_lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self.written = 0
+        self.dropped = 0
+
+    def record(self, business_description: str, ideas: List[Dict[str, Any]], source: str,
+               model: Optional[str] = None, latency: Optional[float] = None,
+               usage: Optional[Dict[str, int]] = None, owner: Optional[str] = None) -> None:
+        """Queue ideas for writing. Never blocks; token usage is per call and
+        is stored on the first idea of the batch only."""
+        if not ideas:
+            return
+        try:
+            self._ensure_writer()
+        except sqlite3.Error as e:
+            self.dropped += len(ideas)
+            app.logger.warning("Idea store unavailable (%s): %s", self.path, e)
+            return
+        now = time.time()
+        usage = usage or {}
+        for i, idea in enumerate(ideas):
+            row = (now, business_description, _normalize_description(business_description), source, model,
+                   round(latency * 1000, 1) if latency is not None else None,
+                   usage.get('input_tokens') if i == 0 else None,
+                   usage.get('output_tokens') if i == 0 else None,
+                   owner,
+                   {k: v for k, v in idea.items() if k != 'id'})
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                self.dropped += 1
+
+    def list(self, owner: str, limit: int = 20, before: Optional[int] = None,
+             business_description: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Newest-first page of ``owner``'s stored ideas, optionally for one description."""
+        sql = "SELECT * FROM ideas WHERE owner = ? AND id < ?"
+        args: List[Any] = [owner, before if before is not None else 2 ** 63 - 1]
+        if business_description:
+            sql += " AND input_key = ?"
+            args.append(_normalize_description(business_description))
+        sql += " ORDER BY id DESC LIMIT ?"
+        args.append(limit)
+        return [self._row_to_dict(r) for r in self._reader().execute(sql, args)]
+
+    def search(self, owner: str, query: str, limit: int = 20, before: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Newest-first page of ``owner``'s ideas whose input, title or script match every word of ``query``."""
+        terms = ' '.join('"{}"'.format(t.replace('"', '""')) for t in query.split())
+        if not terms:
+            return []
+        rows = self._reader().execute(
+            "SELECT ideas.* FROM ideas_fts JOIN ideas ON ideas.id = ideas_fts.rowid "
+            "WHERE ideas_fts MATCH ? AND ideas.owner = ? AND ideas_fts.rowid < ? "
+            "ORDER BY ideas_fts.rowid DESC LIMIT ?",
+            (terms, owner, before if before is not None else 2 ** 63 - 1, limit))
+        return [self._row_to_dict(r) for r in rows]
+
+    def flush(self, timeout: float = 5) -> None:
+        """Wait (up to ``timeout``) until everything queued so far is written."""
+        deadline = time.time() + timeout
+        while self._writer is not None and self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'path': self.path, 'written': self.written, 'dropped': self.dropped, 'queued': self._queue.qsize()}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        self._ensure_writer()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _ensure_writer(self) -> None:
+        # Started lazily so importing the app (tests, bench scripts, bulk.py)
+        # doesn't create a database until something is stored or read.
+        if self._writer is not None:
+            return
+        with self._start_lock:
+            if self._writer is None:
+                conn = self._connect()
+                conn.executescript(self.SCHEMA)
+                if 'owner' not in {row['name'] for row in conn.execute("PRAGMA table_info(ideas)")}:
+                    conn.execute("ALTER TABLE ideas ADD COLUMN owner TEXT")
+                conn.execute("CREATE INDEX IF NOT EXISTS ideas_owner ON ideas (owner, id)")
+                conn.execute("CREATE INDEX IF NOT EXISTS ideas_owner_input_key ON ideas (owner, input_key, id)")
+                conn.close()
+                writer = threading.Thread(target=self._write_loop, name='idea-store-writer', daemon=True)
+                writer.start()
+                self._writer = writer
+
+    def _write_loop(self) -> None:
+        conn = run_blocking(self._connect)
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                run_blocking(self._write_batch, conn, batch)
+                self.written += len(batch)
+            except sqlite3.Error as e:
+                self.dropped += len(batch)
+                app.logger.warning("Idea store write failed, dropped %d rows: %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    @staticmethod
+    def _write_batch(conn: sqlite3.Connection, batch: List[Tuple]) -> None:
+        with conn:
+            for row in batch:
+                *columns, idea = row
+                cur = conn.execute(
+                    "INSERT INTO ideas (created_at, input, input_key, source, model, latency_ms, "
+                    "input_tokens, output_tokens, owner, idea) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (*columns, json.dumps(idea, ensure_ascii=False)))
+                body = ' '.join(str(idea.get(k, '')) for k in ('caption', 'script', 'scriptFull', 'description'))
+                conn.execute("INSERT INTO ideas_fts (rowid, input, title, body) VALUES (?, ?, ?, ?)",
+                             (cur.lastrowid, columns[1], str(idea.get('title', '')), body))
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            'id': row['id'],
+            'createdAt': row['created_at'],
+            'input': row['input'],
+            'source': row['source'],
+            'model': row['model'],
+            'latencyMs': row['latency_ms'],
+            'inputTokens': row['input_tokens'],
+            'outputTokens': row['output_tokens'],
+            'idea': json.loads(row['idea']),
+        }
+
+
+def _normalize_description(business_description: str) -> str:
+    return ' '.join((business_description or '').lower().split())
+
+
+idea_store: Optional[IdeaStore] = IdeaStore(IDEA_DB_PATH, IDEA_DB_QUEUE_SIZE) if IDEA_DB_PATH else None
+if idea_store is not None:
+    atexit.register(idea_store.flush)
+
+
+# Owner of the ideas generated in the current request (see _identify_client).
+# A context variable rather than ``g`` so it reaches the worker pools, which
+# run outside the request context: submit work there with submit_in_context.
+_idea_owner: 'contextvars.ContextVar[Optional[str]]' = contextvars.ContextVar('idea_owner', default=None)
+
+
+def submit_in_context(pool: ThreadPoolExecutor, fn: Callable, *args: Any):
+    """``pool.submit`` that runs ``fn`` with the caller's context variables."""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def store_ideas(business_description: str, ideas: List[Dict[str, Any]], source: str, **details: Any) -> None:
+    """Record newly produced ideas in the persistent store, if enabled."""
+    if idea_store is not None:
+        details.setdefault('owner', _idea_owner.get())
+        idea_store.record(business_description, ideas, source, **details)
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.before_request
+def _identify_client():
+    """Read (or issue) the client token cookie and set the idea owner from it."""
+    token = request.cookies.get(IDEA_OWNER_COOKIE, '')
+    if not 16 <= len(token) <= 64:
+        token = g.new_client_token = secrets.token_urlsafe(24)
+    _idea_owner.set(hashlib.sha256(token.encode()).hexdigest())
+
+
+@app.after_request
+def _set_client_cookie(response):
+    token = g.get('new_client_token')
+    if token:
+        response.set_cookie(IDEA_OWNER_COOKIE, token, max_age=IDEA_OWNER_COOKIE_MAX_AGE,
+                            httponly=True, samesite='Lax', secure=request.is_secure)
+    return response
+
+
+@app.after_request
+def _record_request_time(response):
+    # Observed when the server closes the response, so streamed bodies
+    # (/content-catalyst/stream and /batch) are timed to their last byte.
+    started = g.get('request_started')
+    if started is not None:
+        endpoint = request.endpoint or 'unknown'
+        status = str(response.status_code)
+        response.call_on_close(lambda: metrics.observe(
+            'http_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint, status=status))
+    return response
+
+
+@app.errorhandler(ClaudeOverloadedError)
+def _claude_overloaded(e: ClaudeOverloadedError):
+    """Shed load with a 429 the client can retry after ``Retry-After`` seconds."""
+    response = jsonify({'status': 'error', 'message': str(e), 'retryAfter': e.retry_after})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+
+@app.route('/content-catalyst', methods=['POST'])
+def content_catalyst():
+    """Endpoint that behaves like a small chatbot: accepts a business idea and
+    returns content-marketing ideas."""
+    data = request.get_json() or {}
+    # Accept either 'idea' or 'description' or 'text'
+    business_description = data.get('idea') or data.get('description') or data.get('text') or ''
+
+    if not isinstance(business_description, str) or not business_description.strip():
+        return jsonify({'status': 'error', 'message': 'Please provide a business idea/description.'}), 400
+
+    try:
+        count = max(1, min(int(data.get('count') or 1), IDEA_MAX_COUNT))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'count must be an integer.'}), 400
+
+    if count > 1:
+        return _content_catalyst_multi(business_description, count)
+
+    return jsonify(generate_ideas_response(business_description))
+
+
+def generate_ideas_response(business_description: str, register: bool = True,
+                            priority: int = PRIORITY_INTERACTIVE) -> Dict[str, Any]:
+    """Generate one idea for a description and return the /content-catalyst payload.
+
+    Tries Claude (through the generation cache) and falls back to the local
+    generator. With ``register=False`` the ideas don't get chat sessions,
+    which keeps bulk runs from evicting interactive users' sessions.
+
+    Raises:
+        ClaudeOverloadedError: If the scheduler sheds an interactive call.
+            Batch calls fall back to local ideas instead.
+    """
+    # Try Claude first, fallback to local generator
+    ideas = None
+    error = None
+    cache_status = None
+    similar = None
+    
+    if ANTHROPIC_API_KEY and claude:
+        key = idea_cache_key(business_description)
+        if not idea_cache.contains(key):
+            similar = find_similar_ideas(business_description)
+
+        def generate():
+            return idea_cache.get_or_generate(
+                key,
+                lambda: _generate_and_index(business_description, priority)
+            )
+
+        # Hedge: run Claude on the hedge pool and give up waiting after the
+        # SLO. The call carries on and fills the cache for next time. Batch
+        # items have no latency target, so they are never hedged.
+        hedged = None
+        if not similar and CLAUDE_HEDGE_SLO > 0 and priority != PRIORITY_BATCH:
+            hedged = _submit_hedged(generate)
+        try:
+            if similar:
+                ideas = similar[2]
+            elif hedged is not None:
+                ideas, cache_status = hedged.result(timeout=CLAUDE_HEDGE_SLO)
+            else:
+                ideas, cache_status = generate()
+        except FutureTimeoutError:
+            error = f"Claude missed the {CLAUDE_HEDGE_SLO:g}s latency SLO - using local fallback"
+            metrics.inc('claude_errors_total', kind='ideas', error='hedged')
+        except ClaudeOverloadedError as e:
+            if priority != PRIORITY_BATCH:
+                raise
+            error = str(e)
+        except CircuitOpenError as e:
+            error = str(e)
+        except Exception as e:
+            error = str(e)
+            app.logger.warning("Claude generation failed, falling back to local: %s", error)
+    
+    # Fallback to deterministic generator. Labelled 'local' whether Claude
+    # failed or isn't configured at all.
+    source = 'claude' if ideas else 'local'
+    if not ideas:
+        ideas = generate_marketing_ideas(business_description)
+        
+    response = {
+        'status': 'success',
+        'input': business_description,
+        'ideas': register_ideas(ideas) if register else ideas,
+        'source': source
+    }
+    if similar:
+        response['source'] = 'similar-cache'
+        response['similarity'] = round(similar[0], 4)
+    if error:
+        response['error'] = error
+    if cache_status:
+        response['cache'] = cache_status
+        
+    return response
+
+
+def _content_catalyst_multi(business_description: str, count: int):
+    """Generate ``count`` ideas in parallel within ``IDEA_DEADLINE``.
+
+    Claude ideas that finish in time come first; the rest are topped up from
+    the local generator. ``source`` is ``'claude'``, ``'local'`` or
+    ``'mixed'`` accordingly.
+    """
+    ideas = []
+    error = None
+
+    if ANTHROPIC_API_KEY and claude:
+        ideas, errors = generate_ideas_parallel(business_description, count)
+        if errors:
+            error = f"{len(errors)} of {count} Claude ideas failed: {errors[0]}"
+            app.logger.warning("Claude fan-out incomplete, topping up from local: %s", error)
+    claude_count = len(ideas)
+
+    # Top up from the deterministic generator
+    if claude_count < count:
+        ideas = ideas + generate_marketing_ideas(business_description, count - claude_count)
+
+    if claude_count == count:
+        source = 'claude'
+    elif claude_count == 0:
+        source = 'local'
+    else:
+        source = 'mixed'
+
+    response = {
+        'status': 'success',
+        'input': business_description,
+        'ideas': register_ideas(ideas),
+        'source': source
+    }
+    if error:
+        response['error'] = error
+
+    return jsonify(response)
+
+
+def batch_item_description(item: Any) -> str:
+    """Description for one bulk input item: a plain string or an object with
+    the same 'idea'/'description'/'text' fields /content-catalyst accepts."""
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict):
+        return item.get('idea') or item.get('description') or item.get('text') or ''
+    return ''
+
+
+def _generate_batch_item(index: int, item: Any) -> Dict[str, Any]:
+    business_description = batch_item_description(item)
+    if not isinstance(business_description, str) or not business_description.strip():
+        result = {'status': 'error', 'message': 'Please provide a business idea/description.'}
+    else:
+        try:
+            result = generate_ideas_response(business_description, register=False, priority=PRIORITY_BATCH)
+        except Exception as e:
+            result = {'status': 'error', 'input': business_description, 'message': str(e)}
+    result['index'] = index
+    if isinstance(item, dict) and 'id' in item:
+        result['id'] = item['id']
+    return result
+
+
+def iter_batch_results(items: List[Any], concurrency: int = IDEA_BATCH_CONCURRENCY,
+                       start: int = 0) -> Iterator[Dict[str, Any]]:
+    """Generate ideas for ``items[start:]`` with bounded concurrency.
+
+    Results are yielded in input order as soon as every earlier item is
+    done; each carries its ``index`` (and the item's ``id`` if it had one)
+    so callers can checkpoint and resume from ``start``. At most
+    ``2 * concurrency`` items are in flight or buffered at a time.
+    """
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='idea-batch')
+    pending = deque()
+    try:
+        for index in range(start, len(items)):
+            pending.append(submit_in_context(pool, _generate_batch_item, index, items[index]))
+            if len(pending) >= 2 * concurrency:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def batch_sync_limit(concurrency: int) -> Optional[int]:
+    """Most batch items one request can take at ``concurrency``, or None
+    when an async (gevent) worker serves it.
+
+    A sync worker is killed if a response streams for longer than
+    ``GUNICORN_TIMEOUT``, and each item can take up to ``IDEA_DEADLINE``,
+    so the batch gets as many rounds of ``concurrency`` items as fit in the
+    timeout with one round to spare.
+    """
+    if gevent_patched('socket'):
+        return None
+    return concurrency * max(1, int(GUNICORN_TIMEOUT // IDEA_DEADLINE) - 1)
+
+
+@app.route('/content-catalyst/batch', methods=['POST'])
+def content_catalyst_batch():
+    """Bulk generation for many descriptions in one request.
+
+    Accepts JSON { "items": [...], "concurrency": n, "start": k } or a JSONL
+    body (one item per line, ``concurrency``/``start`` as query parameters).
+    Items are strings or objects with a description and an optional ``id``.
+    Streams NDJSON back, one result per item in input order, each with its
+    ``index``. Clients must handle interrupted runs themselves: resend the
+    same items with ``start`` set to the index after the last line received.
+
+    Under sync workers a batch must finish within the worker timeout, so
+    requests with more remaining items than ``batch_sync_limit`` allows are
+    rejected with 400.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        items = data.get('items')
+        options = data
+    else:
+        items = []
+        for lineno, line in enumerate(request.get_data(as_text=True).splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                return jsonify({'status': 'error', 'message': f'Line {lineno} is not valid JSON.'}), 400
+        options = request.args
+
+    if not isinstance(items, list) or not items:
+        return jsonify({'status': 'error', 'message': 'Provide a non-empty items array or JSONL body.'}), 400
+    if len(items) > IDEA_BATCH_MAX_ITEMS:
+        return jsonify({'status': 'error', 'message': f'At most {IDEA_BATCH_MAX_ITEMS} items per batch.'}), 400
+
+    try:
+        concurrency = max(1, min(int(options.get('concurrency') or IDEA_BATCH_CONCURRENCY), IDEA_BATCH_MAX_CONCURRENCY))
+        start = max(0, int(options.get('start') or 0))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'concurrency and start must be integers.'}), 400
+
+    limit = batch_sync_limit(concurrency)
+    if limit is not None and len(items) - start > limit:
+        return jsonify({'status': 'error', 'message': (
+            f'Sync workers can only finish {limit} items per request at concurrency {concurrency} '
+            f'before the worker timeout. Send smaller batches, or serve with GUNICORN_WORKER_CLASS=gevent.')}), 400
+
+    def lines():
+        for result in iter_batch_results(items, concurrency, start):
+            yield json.dumps(result, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+
+
+def _sse(event: str, data: Any) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route('/content-catalyst/stream', methods=['GET', 'POST'])
+def content_catalyst_stream():
+    """Server-sent events variant of /content-catalyst.
+
+    Accepts the same fields as JSON (POST) or query parameters (GET). Emits a
+    ``field`` event for each idea field as soon as Claude finishes it, then a
+    ``done`` event whose data has the same shape as the /content-catalyst
+    response. If Claude fails mid-stream an ``error`` event is sent and the
+    ``done`` event carries the local fallback ideas. When the Claude queue is
+    already full the request gets a 429 before the stream starts.
+    """
+    data = request.args if request.method == 'GET' else (request.get_json(silent=True) or {})
+    business_description = data.get('idea') or data.get('description') or data.get('text') or ''
+
+    if not isinstance(business_description, str) or not business_description.strip():
+        return jsonify({'status': 'error', 'message': 'Please provide a business idea/description.'}), 400
+    if ANTHROPIC_API_KEY and claude:
+        claude_scheduler.check_queue('ideas', PRIORITY_INTERACTIVE)
+
+    def events():
+        ideas = None
+        error = None
+        cache_status = None
+
+        similar = None
+
+        if ANTHROPIC_API_KEY and claude:
+            key = idea_cache_key(business_description)
+            ideas = idea_cache.get(key)
+            if ideas:
+                cache_status = 'hit'
+            else:
+                similar = find_similar_ideas(business_description)
+                ideas = similar[2] if similar else None
+            if ideas:
+                for index, idea in enumerate(ideas):
+                    for field in IDEA_REQUIRED_FIELDS:
+                        yield _sse('field', {'index': index, 'field': field, 'value': idea.get(field)})
+            else:
+                try:
+                    for kind, payload in call_claude_for_ideas_stream(business_description):
+                        if kind == 'field':
+                            yield _sse('field', payload)
+                        else:
+                            ideas = payload
+                    cache_status = 'miss'
+                    idea_cache.put(key, ideas)
+                    if idea_similarity is not None:
+                        idea_similarity.add(business_description, ideas, similarity_tag())
+                except ClaudeOverloadedError as e:
+                    error = str(e)
+                    yield _sse('error', {'message': error, 'retryAfter': e.retry_after})
+                except Exception as e:
+                    error = str(e)
+                    app.logger.warning("Claude streaming failed, falling back to local: %s", error)
+                    yield _sse('error', {'message': error})
+
+        # Fallback to deterministic generator
+        source = 'claude' if ideas else 'local'
+        if not ideas:
+            ideas = generate_marketing_ideas(business_description)
+
+        response = {
+            'status': 'success',
+            'input': business_description,
+            'ideas': register_ideas(ideas),
+            'source': source
+        }
+        if similar:
+            response['source'] = 'similar-cache'
+            response['similarity'] = round(similar[0], 4)
+        if error:
+            response['error'] = error
+        if cache_status:
+            response['cache'] = cache_status
+        yield _sse('done', response)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters and current size of the generation and similarity
+    caches, plus prompt-cache token usage per kind of Claude call."""
+    return jsonify({
+        'status': 'success',
+        'cache': idea_cache.stats(),
+        'similarCache': idea_similarity.stats() if idea_similarity is not None else None,
+        'promptCache': usage_stats.stats(),
+        'ideaStore': idea_store.stats() if idea_store is not None else None,
+    })
+
+
+@app.route('/idea-chat', methods=['POST'])
+def idea_chat():
+    """Handle follow-up chat about a specific idea.
+
+    Expects JSON: { "idea_id": "...", "question": "..." } using the ``id`` of
+    an idea returned by /content-catalyst. The server keeps the conversation
+    history for that idea. Clients may instead (or additionally, as a
+    fallback for expired sessions) send { "idea": { ... } }, which starts a
+    new session.
+    Returns JSON: { status: 'success', reply: 'text', idea_id: '...' }
+    """
+    data = request.get_json() or {}
+    idea_id = data.get('idea_id') or data.get('ideaId')
+    idea = data.get('idea')
+    question = (data.get('question') or '').strip()
+
+    if not question:
+        return jsonify({'status': 'error', 'message': 'Provide an idea_id (or idea object) and a non-empty question.'}), 400
+
+    session = idea_sessions.get(idea_id) if idea_id else None
+    if session is None:
+        if not idea or not isinstance(idea, dict):
+            if idea_id:
+                return jsonify({'status': 'error', 'message': 'Unknown or expired idea_id; resend the idea object.'}), 404
+            return jsonify({'status': 'error', 'message': 'Provide an idea_id (or idea object) and a non-empty question.'}), 400
+        idea_id = idea_sessions.create(idea)
+        session = idea_sessions.get(idea_id) or {'idea': idea, 'history': [], 'summary': ''}
+
+    try:
+        reply = call_claude_followup(session['idea'], question, history=session['history'], summary=session['summary'])
+    except ClaudeOverloadedError:
+        raise
+    except Exception as e:
+        reply = str(e)
+    else:
+        if reply not in (FOLLOWUP_UNAVAILABLE_REPLY, FOLLOWUP_ERROR_REPLY):
+            idea_sessions.add_turn(idea_id, question, reply)
+
+    return jsonify({'status': 'success', 'reply': reply, 'idea_id': idea_id})
+
+
+def _ideas_page_args() -> Tuple[int, Optional[int]]:
+    """``limit`` (1-100, default 20) and ``before`` cursor from the query string."""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
+    except ValueError:
+        limit = 20
+    try:
+        before = int(request.args['before']) if request.args.get('before') else None
+    except ValueError:
+        before = None
+    return limit, before
+
+
+def _ideas_page(rows: List[Dict[str, Any]], limit: int):
+    return jsonify({
+        'status': 'success',
+        'ideas': rows,
+        'nextCursor': rows[-1]['id'] if len(rows) == limit else None,
+    })
+
+
+@app.route('/ideas', methods=['GET'])
+def list_ideas():
+    """Ideas previously generated for this client (its cookie), newest first.
+
+    Query params: ``input`` (only ideas generated for this description,
+    ignoring case and whitespace), ``limit`` and ``before`` (the
+    ``nextCursor`` of the previous page).
+    """
+    if idea_store is None:
+        return jsonify({'status': 'error', 'message': 'Idea history is disabled.'}), 404
+    limit, before = _ideas_page_args()
+    try:
+        rows = idea_store.list(_idea_owner.get(), limit, before, request.args.get('input'))
+    except sqlite3.Error as e:
+        app.logger.warning("Idea store read failed: %s", e)
+        return jsonify({'status': 'error', 'message': 'Idea history is unavailable.'}), 503
+    return _ideas_page(rows, limit)
+
+
+@app.route('/ideas/search', methods=['GET'])
+def search_ideas():
+    """Full-text search over this client's stored ideas' input, title and script.
+
+    Query params: ``q`` (every word must match), ``limit`` and ``before``.
+    Results are newest first so the cursor works the same as /ideas.
+    """
+    if idea_store is None:
+        return jsonify({'status': 'error', 'message': 'Idea history is disabled.'}), 404
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({'status': 'error', 'message': 'Provide a search query (q).'}), 400
+    limit, before = _ideas_page_args()
+    try:
+        rows = idea_store.search(_idea_owner.get(), query, limit, before)
+    except sqlite3.Error as e:
+        app.logger.warning("Idea store search failed: %s", e)
+        return jsonify({'status': 'error', 'message': 'Idea history is unavailable.'}), 503
+    return _ideas_page(rows, limit)
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness plus the state of the Claude dependency.
+
+    Always 200 while the app can serve (it falls back to local ideas), with
+    ``status: 'degraded'`` when Claude is unconfigured or its circuit is not
+    closed.
+    """
+    breaker = claude_breaker.stats()
+    configured = bool(ANTHROPIC_API_KEY and claude)
+    return jsonify({
+        'status': 'ok' if configured and breaker['state'] == 'closed' else 'degraded',
+        'claude': {
+            'configured': configured,
+            'model': CLAUDE_MODEL,
+            'circuit': breaker,
+            'scheduler': claude_scheduler.stats(),
+            'router': model_router.stats(),
+            'hedgeSlo': CLAUDE_HEDGE_SLO or None,
+        },
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text-format metrics for this worker process.
+
+    Stage timers, Claude errors by class and token usage come from the
+    ``metrics`` registry; cache, session and circuit breaker figures are
+    read at scrape time.
+    """
+    cache = idea_cache.stats()
+    sessions = idea_sessions.stats()
+    breaker = claude_breaker.stats()
+    scheduler = claude_scheduler.stats()
+    gauges = [
+        ('idea_cache_hits_total', 'counter', cache['hits']),
+        ('idea_cache_misses_total', 'counter', cache['misses']),
+        ('idea_cache_coalesced_total', 'counter', cache['coalesced']),
+        ('idea_cache_evictions_total', 'counter', cache['evictions']),
+        ('idea_cache_entries', 'gauge', cache['entries']),
+        ('idea_cache_bytes', 'gauge', cache['bytes']),
+        ('idea_sessions', 'gauge', sessions['sessions']),
+        ('idea_sessions_bytes', 'gauge', sessions['bytes']),
+        ('claude_circuit_open', 'gauge', {'closed': 0, 'half_open': 0.5, 'open': 1}[breaker['state']]),
+        ('claude_circuit_error_rate', 'gauge', breaker['errorRate']),
+        ('claude_circuit_rejected_total', 'counter', breaker['rejected']),
+        ('claude_inflight', 'gauge', scheduler['inflight']),
+        ('claude_queue_depth', 'gauge', scheduler['queued']),
+    ]
+    if idea_store is not None:
+        store = idea_store.stats()
+        gauges += [
+            ('idea_store_written_total', 'counter', store['written']),
+            ('idea_store_dropped_total', 'counter', store['dropped']),
+            ('idea_store_queued', 'gauge', store['queued']),
+        ]
+    if idea_similarity is not None:
+        similar = idea_similarity.stats()
+        gauges += [
+            ('idea_similar_cache_hits_total', 'counter', similar['hits']),
+            ('idea_similar_cache_misses_total', 'counter', similar['misses']),
+            ('idea_similar_cache_entries', 'gauge', similar['entries']),
+        ]
+    lines = []
+    for name, kind, value in gauges:
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {value:g}")
+    body = metrics.render() + '\n'.join(lines) + '\n'
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 
-    return jsonify({'status': 'success', 'reply': reply})
+@app.route('/session-stats', methods=['GET'])
+def session_stats():
+    """Current size of the follow-up chat session store."""
+    return jsonify({'status': 'success', 'sessions': idea_sessions.stats()})
 
 
 if __name__ == '__main__':
@@ -0,0 +1,344 @@
+"""Load test for the app under gunicorn, against a stub Claude API.
+
+Starts ``bench/stub_claude.py`` and ``gunicorn app:app`` (using the repo's
+``gunicorn.conf.py``) with the app pointed at the stub, then drives
+``/content-catalyst`` and ``/idea-chat`` from ``--concurrency`` client
+threads for ``--duration`` seconds. Reports requests/sec, p50/p95/p99
+latency, fallback and 429 rates per endpoint, plus the resident memory of
+each gunicorn worker (Linux /proc).
+
+Every description is unique so the generation cache never hits, and the
+similarity cache is off unless ``--with-caches`` is given. Extra app
+settings can be passed with ``--env NAME=VALUE`` (repeatable).
+
+Results can be saved with ``--json`` (they include the git commit) and
+compared with an earlier run with ``--compare``.
+
+The run fails (exit status 1, nothing saved) if the stub saw no requests:
+the app never reached it, e.g. because the anthropic SDK is missing or
+the client failed to build, so every idea was a local fallback and the
+numbers say nothing about the Claude path.
+
+Usage:
+    python bench/load_test.py [--concurrency 32] [--duration 30] [--workers 2] [--worker-class gevent]
+        [--chat-ratio 0.3] [--latency lognormal:1.5,0.5] [--error-rate 0.02] [--malformed-rate 0.05]
+        [--json results.json] [--compare baseline.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import app  # noqa: E402
+
+CANNED_REPLIES = {app.FOLLOWUP_UNAVAILABLE_REPLY, app.FOLLOWUP_ERROR_REPLY}
+
+PRODUCTS = ['coffee roastery', 'yoga studio', 'bakery', 'dog grooming salon', 'skincare line', 'bike repair shop',
+            'tea brand', 'ceramics studio', 'language school', 'sneaker store', 'meal kit', 'bookstore']
+AUDIENCES = ['students', 'busy parents', 'remote workers', 'pet owners', 'runners', 'retirees', 'travelers']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+
+def request(port, method, path, body=None, timeout=120):
+    """One request on a fresh connection. Returns (status, parsed JSON or None)."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        data = json.dumps(body).encode() if body is not None else None
+        conn.request(method, path, body=data, headers={'Content-Type': 'application/json'} if data else {})
+        resp = conn.getresponse()
+        raw = resp.read()
+        try:
+            return resp.status, json.loads(raw)
+        except ValueError:
+            return resp.status, None
+    finally:
+        conn.close()
+
+
+def wait_until_up(port, proc, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"Process exited early with code {proc.returncode}")
+        try:
+            request(port, 'GET', '/health', timeout=2)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"Nothing listening on port {port} after {timeout}s")
+
+
+def worker_pids(master_pid):
+    """PIDs of the gunicorn workers forked by ``master_pid``."""
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == master_pid:
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+def memory_mb(pid):
+    """(current RSS, peak RSS) of ``pid`` in MB, or None if it is gone."""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    name, value = line.split(':')
+                    values[name] = int(value.split()[0]) / 1024
+    except OSError:
+        return None
+    return round(values.get('VmRSS', 0), 1), round(values.get('VmHWM', 0), 1)
+
+
+class LoadDriver:
+    """Client threads issuing requests until a deadline and recording outcomes."""
+
+    def __init__(self, port, chat_ratio, timeout):
+        self.port = port
+        self.chat_ratio = chat_ratio
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.samples = []  # (endpoint, status, seconds, fallback)
+        self.ideas = []  # recent (id, idea) pairs to chat about
+        self.recording = False
+
+    def run(self, concurrency, seconds):
+        deadline = time.time() + seconds
+        threads = [threading.Thread(target=self._loop, args=(deadline,), daemon=True) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def _loop(self, deadline):
+        rng = random.Random()
+        while time.time() < deadline:
+            with self.lock:
+                known = rng.choice(self.ideas) if self.ideas else None
+            if known and rng.random() < self.chat_ratio:
+                self._chat(*known)
+            else:
+                self._generate(rng)
+
+    def _generate(self, rng):
+        description = (f"{rng.choice(PRODUCTS)} for {rng.choice(AUDIENCES)}, "
+                       f"launch code {uuid.uuid4().hex[:8]}")
+        started = time.perf_counter()
+        try:
+            status, data = request(self.port, 'POST', '/content-catalyst', {'idea': description}, self.timeout)
+        except OSError:
+            status, data = 0, None
+        elapsed = time.perf_counter() - started
+        fallback = status == 200 and (data or {}).get('source') not in ('claude', 'similar-cache')
+        if status == 200 and data:
+            with self.lock:
+                self.ideas.extend((idea['id'], idea) for idea in data.get('ideas', []) if idea.get('id'))
+                del self.ideas[:-500]
+        self._record('content-catalyst', status, elapsed, fallback)
+
+    def _chat(self, idea_id, idea):
+        question = {'idea_id': idea_id, 'question': 'How should I cut the first 3 seconds?'}
+        started = time.perf_counter()
+        try:
+            status, data = request(self.port, 'POST', '/idea-chat', question, self.timeout)
+            if status == 404:
+                # The session lives in another worker (or expired): resend the
+                # idea like the UI does, and keep the time of both requests.
+                idea = {k: v for k, v in idea.items() if k not in ('id', 'sessionId')}
+                status, data = request(self.port, 'POST', '/idea-chat', dict(question, idea=idea), self.timeout)
+        except OSError:
+            status, data = 0, None
+        elapsed = time.perf_counter() - started
+        fallback = status == 200 and (data or {}).get('reply') in CANNED_REPLIES
+        self._record('idea-chat', status, elapsed, fallback)
+
+    def _record(self, endpoint, status, elapsed, fallback):
+        if self.recording:
+            with self.lock:
+                self.samples.append((endpoint, status, elapsed, fallback))
+
+
+def summarize(samples, seconds):
+    latencies = [s[2] for s in samples]
+    ok = [s for s in samples if s[1] == 200]
+    statuses = {}
+    for s in samples:
+        statuses[str(s[1])] = statuses.get(str(s[1]), 0) + 1
+    return {
+        'requests': len(samples),
+        'rps': round(len(samples) / seconds, 2),
+        'p50Ms': round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        'p95Ms': round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        'p99Ms': round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        'fallbackRate': round(sum(1 for s in ok if s[3]) / len(ok), 4) if ok else None,
+        'shedRate': round(statuses.get('429', 0) / len(samples), 4) if samples else None,
+        'statuses': statuses,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results):
+    for name, r in [('all', results['overall'])] + list(results['endpoints'].items()):
+        if not r['requests']:
+            continue
+        fallback = f"{r['fallbackRate']:.1%}" if r['fallbackRate'] is not None else '-'
+        print(f"{name:17s} {r['requests']:6d} req  {r['rps']:8.2f} req/s  p50 {r['p50Ms']:8.1f} ms  "
+              f"p95 {r['p95Ms']:8.1f} ms  p99 {r['p99Ms']:8.1f} ms  fallback {fallback:>6s}  "
+              f"429 {r['shedRate']:.1%}")
+    for w in results['workers']:
+        print(f"worker {w['pid']:>7d}  rss {w['rssMb']:7.1f} MB  peak {w['peakRssMb']:7.1f} MB")
+    print(f"stub: {results['stub']}")
+
+
+def print_comparison(results, baseline):
+    print(f"\nvs {baseline.get('commit') or 'baseline'}:")
+    for name in ['overall'] + sorted(results['endpoints']):
+        new = results['overall'] if name == 'overall' else results['endpoints'][name]
+        old = baseline.get('overall') if name == 'overall' else baseline.get('endpoints', {}).get(name)
+        if not old or not new['requests']:
+            continue
+        parts = []
+        for key in ('rps', 'p50Ms', 'p95Ms', 'p99Ms'):
+            if old.get(key) and new.get(key) is not None:
+                parts.append(f"{key} {(new[key] - old[key]) / old[key]:+.1%}")
+        for key in ('fallbackRate', 'shedRate'):
+            if old.get(key) is not None and new.get(key) is not None:
+                parts.append(f"{key} {old[key]:.1%} -> {new[key]:.1%}")
+        print(f"{name:17s} " + '  '.join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--concurrency', type=int, default=32, help='Client threads')
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=3, help='Unmeasured seconds before the run')
+    parser.add_argument('--workers', type=int, default=2, help='WEB_CONCURRENCY')
+    parser.add_argument('--worker-class', default='gevent', choices=['sync', 'gevent'])
+    parser.add_argument('--chat-ratio', type=float, default=0.3, help='Share of requests sent to /idea-chat')
+    parser.add_argument('--latency', default='lognormal:1.5,0.5', help='Stub latency, see stub_claude.py')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--malformed-rate', type=float, default=0.0)
+    parser.add_argument('--with-caches', action='store_true', help='Keep the similarity cache on')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE', help='Extra app setting')
+    parser.add_argument('--timeout', type=float, default=120, help='Client timeout per request')
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--compare', help='Earlier --json results to compare against')
+    args = parser.parse_args()
+
+    stub_port, app_port = free_port(), free_port()
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'bench', 'stub_claude.py'), '--port', str(stub_port),
+         '--latency', args.latency, '--error-rate', str(args.error_rate),
+         '--rate-limit-rate', str(args.rate_limit_rate), '--malformed-rate', str(args.malformed_rate)],
+        stdout=subprocess.DEVNULL)
+    tmp = tempfile.TemporaryDirectory(prefix='idea-load-')
+    env = dict(os.environ,
+               PORT=str(app_port),
+               WEB_CONCURRENCY=str(args.workers),
+               GUNICORN_WORKER_CLASS=args.worker_class,
+               ANTHROPIC_API_KEY='stub-key',
+               ANTHROPIC_BASE_URL=f'http://127.0.0.1:{stub_port}',
+               IDEA_DB_PATH=os.path.join(tmp.name, 'ideas.db'),
+               LOG_LEVEL='ERROR')
+    if not args.with_caches:
+        env['IDEA_SIMILAR_MAX'] = '0'
+    for item in args.env:
+        name, _, value = item.partition('=')
+        env[name] = value
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app:app', '--log-level', 'warning'],
+                              cwd=ROOT, env=env)
+
+    try:
+        wait_until_up(stub_port, stub)
+        wait_until_up(app_port, server)
+        driver = LoadDriver(app_port, args.chat_ratio, args.timeout)
+        if args.warmup:
+            driver.run(args.concurrency, args.warmup)
+
+        pids = worker_pids(server.pid)
+        driver.recording = True
+        started = time.time()
+        driver.run(args.concurrency, args.duration)
+        elapsed = time.time() - started
+
+        workers = []
+        for pid in pids:
+            mem = memory_mb(pid)
+            if mem:
+                workers.append({'pid': pid, 'rssMb': mem[0], 'peakRssMb': mem[1]})
+        _, stub_stats = request(stub_port, 'GET', '/stats')
+    finally:
+        server.terminate()
+        stub.terminate()
+        server.wait(timeout=30)
+        stub.wait(timeout=10)
+        tmp.cleanup()
+
+    samples = driver.samples
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'config': {k: v for k, v in vars(args).items() if k not in ('json', 'compare')},
+        'seconds': round(elapsed, 2),
+        'overall': summarize(samples, elapsed),
+        'endpoints': {
+            name: summarize([s for s in samples if s[0] == name], elapsed)
+            for name in ('content-catalyst', 'idea-chat')
+        },
+        'workers': workers,
+        'stub': stub_stats,
+    }
+
+    print_report(results)
+    if not (stub_stats or {}).get('requests'):
+        print("\nERROR: the stub Claude API received no requests, so the app never called Claude and "
+              "every idea is a local fallback. Check that the anthropic SDK is installed and that "
+              "/health shows Claude configured. Results not saved.", file=sys.stderr)
+        raise SystemExit(1)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Micro-benchmark for the Claude response parser.
+
+Runs every sample in ``bench/corpus/raw_responses.jsonl`` through the
+current extractor (``app.extract_json_object``) and through the legacy
+find/rfind/count pipeline it replaced, and reports parse throughput and
+success rate for each.
+
+Usage:
+    python bench/parse_bench.py [--iterations 2000] [--json results.json]
+
+To add a sample, append a line ``{"name": ..., "expect": "ok"|"error",
+"text": <raw response>}`` to the corpus. Raw responses pasted from the
+server's ``=== Raw Claude response ===`` log (see README) belong there.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus', 'raw_responses.jsonl')
+
+
+def legacy_extract(text):
+    """The pre-extractor parsing steps, without the debug prints."""
+    text = text.strip()
+    if not text.startswith('{'):
+        json_start = text.find('{')
+        if json_start < 0:
+            raise ValueError("No JSON object found in response")
+        text = text[json_start:]
+    if not text.endswith('}'):
+        json_end = text.rfind('}')
+        if json_end < 0:
+            raise ValueError("No complete JSON object found")
+        text = text[:json_end + 1]
+    if text.count('{') != text.count('}'):
+        raise ValueError("Mismatched braces in JSON")
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {str(e)}")
+    json.dumps(data.get('ideas'), indent=2)  # the old code pretty-printed every response
+    return data
+
+
+def validate(data):
+    """Same checks as app.parse_ideas_response after extraction."""
+    if not isinstance(data, dict) or not isinstance(data.get('ideas'), list):
+        raise ValueError("Response missing 'ideas' array")
+    return [app.clean_idea(idea) for idea in data['ideas'][:1] if isinstance(idea, dict)]
+
+
+def load_corpus(path=CORPUS):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run(extract, samples, iterations):
+    correct = 0
+    failures = []
+    for sample in samples:
+        try:
+            validate(extract(sample['text']))
+            got = 'ok'
+        except ValueError:
+            got = 'error'
+        if got == sample['expect']:
+            correct += 1
+        else:
+            failures.append(sample['name'])
+
+    total_bytes = sum(len(s['text'].encode('utf-8')) for s in samples)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for sample in samples:
+            try:
+                extract(sample['text'])
+            except ValueError:
+                pass
+    elapsed = time.perf_counter() - start
+    parses = iterations * len(samples)
+    return {
+        'samples': len(samples),
+        'correct': correct,
+        'successRate': round(correct / len(samples), 4),
+        'failures': failures,
+        'parsesPerSec': round(parses / elapsed),
+        'usPerParse': round(elapsed / parses * 1e6, 2),
+        'mbPerSec': round(total_bytes * iterations / elapsed / 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--corpus', default=CORPUS)
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    samples = load_corpus(args.corpus)
+    results = {
+        'extractor': run(app.extract_json_object, samples, args.iterations),
+        'legacy': run(legacy_extract, samples, args.iterations),
+    }
+
+    for name, r in results.items():
+        print(f"{name:10s} {r['correct']}/{r['samples']} correct  "
+              f"{r['parsesPerSec']:>8d} parses/s  {r['usPerParse']:>7.2f} us/parse  {r['mbPerSec']:>6.2f} MB/s")
+        if r['failures']:
+            print(f"{'':10s} wrong on: {', '.join(r['failures'])}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Lookup-latency benchmark for the near-duplicate similarity cache.
+
+Fills an ``app.SimilarityIndex`` with synthetic business descriptions
+(100k by default), then times lookups and reports p50/p95/p99 latency, hit
+rate and index memory for three query sets:
+
+- ``paraphrase``: an indexed description reworded (shuffled, filler words
+  added or dropped, plurals changed, a typo) - these should hit.
+- ``swap``: an indexed description with one content word swapped (city,
+  audience, product, men/women, a number) - a different business, so any
+  hit is a false positive.
+- ``unrelated``: descriptions unlike anything indexed.
+
+For each set the report also gives ``vectorHitRate``, the hit rate the
+cosine threshold alone would give without the ``app.same_business`` check.
+
+Usage:
+    python bench/similarity_bench.py [--entries 100000] [--queries 2000] [--dim 256] [--threshold 0.75] [--json results.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app  # noqa: E402
+
+FILLER = ['a', 'the', 'small', 'my', 'our', 'very']
+GENDERS = ['men', 'women', 'kids', 'moms', 'dads']
+
+ADJECTIVES = ['smart', 'organic', 'handmade', 'eco-friendly', 'luxury', 'affordable', 'local', 'vegan',
+              'portable', 'custom', 'vintage', 'premium', 'minimalist', 'family-run', 'mobile', 'indoor']
+PRODUCTS = ['garden', 'coffee roastery', 'candle shop', 'yoga studio', 'bakery', 'dog grooming salon',
+            'skincare line', 'bike repair shop', 'tea brand', 'furniture studio', 'meal kit', 'gym',
+            'bookstore', 'ceramics studio', 'phone case brand', 'language school', 'sneaker store']
+AUDIENCES = ['apartments', 'students', 'busy parents', 'remote workers', 'pet owners', 'runners',
+             'small businesses', 'retirees', 'gamers', 'new homeowners', 'travelers', 'teens']
+CITIES = ['Portland', 'Austin', 'Denver', 'Chicago', 'Miami', 'Seattle', 'Boston', 'Atlanta']
+
+
+def make_description(rng):
+    audience = rng.choice(AUDIENCES + GENDERS)
+    return (f"{rng.choice(ADJECTIVES)} {rng.choice(ADJECTIVES)} {rng.choice(PRODUCTS)} for "
+            f"{audience} in {rng.choice(CITIES)}")
+
+
+def typo(word, rng):
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1:] if rng.random() < 0.5 else word[:i] + word[i] + word[i:]
+
+
+def paraphrase(description, rng):
+    """Reword like a user would: reorder, add or drop filler, change plurals, one typo."""
+    words = [w for w in description.split() if w not in ('for', 'in') or rng.random() < 0.5]
+    rng.shuffle(words)
+    for _ in range(rng.randint(0, 2)):
+        words.insert(rng.randrange(len(words) + 1), rng.choice(FILLER))
+    if rng.random() < 0.3:
+        i = rng.randrange(len(words))
+        if len(words[i]) > 3 and words[i][-1].isalpha():
+            words[i] = words[i][:-1] if words[i].endswith('s') else words[i] + 's'
+    if rng.random() < 0.3:
+        long_words = [i for i, w in enumerate(words) if len(w) >= 6 and w.isalpha()]
+        if long_words:
+            i = rng.choice(long_words)
+            words[i] = typo(words[i], rng)
+    if rng.random() < 0.5:
+        words = [w.capitalize() for w in words]
+    return ' '.join(words)
+
+
+def swap(description, rng):
+    """Change one content word so it describes a different business."""
+    for pool in rng.sample([CITIES, AUDIENCES + GENDERS, PRODUCTS, ADJECTIVES], 4):
+        present = [p for p in pool if f' {p} ' in f' {description} ']
+        if present:
+            old = rng.choice(present)
+            new = rng.choice([p for p in pool if p != old and p not in description])
+            return f' {description} '.replace(f' {old} ', f' {new} ', 1).strip()
+    return description + f" {rng.randrange(10)}"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--dim', type=int, default=app.IDEA_SIMILAR_DIM)
+    parser.add_argument('--threshold', type=float, default=app.IDEA_SIMILAR_THRESHOLD)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    if app.np is None:
+        raise SystemExit("numpy is required for the similarity cache")
+
+    rng = random.Random(args.seed)
+    index = app.SimilarityIndex(args.entries, args.dim, args.threshold, ttl=3600)
+    tag = app.similarity_tag()
+    ideas = [{'title': 'stored idea'}]
+
+    descriptions = [make_description(rng) for _ in range(args.entries)]
+    start = time.perf_counter()
+    for description in descriptions:
+        index.add(description, ideas, tag)
+    add_seconds = time.perf_counter() - start
+
+    results = {'entries': args.entries, 'dim': args.dim, 'threshold': args.threshold,
+               'indexBytes': index.stats()['bytes'], 'addsPerSec': round(args.entries / add_seconds)}
+
+    indexed = {frozenset(app._content_words(d)) for d in descriptions}
+    for kind in ('paraphrase', 'swap', 'unrelated'):
+        latencies = []
+        hits = 0
+        vector_hits = 0
+        queries = 0
+        while queries < args.queries:
+            if kind == 'paraphrase':
+                query = paraphrase(rng.choice(descriptions), rng)
+            elif kind == 'swap':
+                query = swap(rng.choice(descriptions), rng)
+                if frozenset(app._content_words(query)) in indexed:
+                    continue  # the swap happens to describe another indexed business
+            else:
+                query = f"{rng.choice(PRODUCTS)} subscription box with quarterly {rng.choice(PRODUCTS)} drops"
+            queries += 1
+            t = time.perf_counter()
+            match = index.lookup(query, tag)
+            latencies.append((time.perf_counter() - t) * 1000)
+            hits += match is not None
+            best = index.search(query, tag, k=1)
+            vector_hits += bool(best) and best[0][0] >= args.threshold
+        results[kind] = {
+            'queries': args.queries,
+            'hitRate': round(hits / args.queries, 4),
+            'vectorHitRate': round(vector_hits / args.queries, 4),
+            'p50Ms': round(percentile(latencies, 0.50), 3),
+            'p95Ms': round(percentile(latencies, 0.95), 3),
+            'p99Ms': round(percentile(latencies, 0.99), 3),
+        }
+
+    print(f"{args.entries} entries x {args.dim} dims, index {results['indexBytes'] / 1e6:.1f} MB, "
+          f"{results['addsPerSec']} adds/s")
+    for kind in ('paraphrase', 'swap', 'unrelated'):
+        r = results[kind]
+        print(f"{kind:10s} hit rate {r['hitRate']:6.1%} (vector only {r['vectorHitRate']:6.1%})  p50 {r['p50Ms']:.2f} ms  p95 {r['p95Ms']:.2f} ms  "
+              f"p99 {r['p99Ms']:.2f} ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""Local stand-in for the Anthropic Messages API, for load tests.
+
+Serves ``POST /v1/messages`` with canned responses after a configurable
+delay, so the app can be benchmarked without spending API money. Point
+the app at it with ``ANTHROPIC_BASE_URL=http://127.0.0.1:<port>`` (the SDK
+reads it) and any non-empty ``ANTHROPIC_API_KEY``.
+
+Idea requests get a valid single-idea JSON response; follow-up requests
+(system prompt containing ``IDEA_CONTEXT``) get a short text reply. A
+fraction of requests can fail with 500/529 (``--error-rate``) or 429
+(``--rate-limit-rate``), or return malformed JSON (``--malformed-rate``).
+
+Latency is ``--latency KIND:ARGS`` in seconds:
+    fixed:1.2              always 1.2s
+    uniform:0.5,3          uniformly between 0.5s and 3s
+    lognormal:1.5,0.5      median 1.5s, sigma 0.5 (long right tail)
+
+Usage:
+    python bench/stub_claude.py [--port 8765] [--latency lognormal:1.5,0.5] [--error-rate 0.02]
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+IDEA = {
+    'format': 'Reel/TikTok (9:16)',
+    'title': 'Three things nobody tells you',
+    'caption': 'Save this before your next visit',
+    'script': 'Hook: You are doing it wrong.\nBeat 1: The mistake.\nBeat 2: The fix.\nCTA: Follow for part 2.',
+    'scriptFull': '0-3s hook on a close-up; 3-10s mistake with jump cuts; 10-20s fix with text overlay; '
+                  '20-25s CTA over the product shot.',
+    'editingNotes': ['Jump cut every 1-2s', 'Bold captions on every line', 'Trending audio at low volume'],
+    'tone': 'playful, confident',
+    'duration': '25s',
+    'apps': ['CapCut', 'InShot'],
+}
+
+MALFORMED = [
+    '{"ideas": [{"format": "Reel", "title": "Cut off mid-',
+    'Sorry, I cannot help with that.',
+    '{"ideas": "not a list"}',
+    '{"ideas": [{"title": "missing every other field"}]}',
+]
+
+REPLY = ("Open on the product in the first second, cut every 1-2 seconds, and put the hook as bold "
+         "on-screen text. Keep the music under the voiceover and end on a 2s CTA card.")
+
+
+def parse_latency(spec):
+    """Turn a ``KIND:ARGS`` spec into a zero-argument sampler (seconds)."""
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',') if v]
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        median, sigma = values
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class StubState:
+    def __init__(self, latency, error_rate, rate_limit_rate, malformed_rate):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'errors': 0, 'rateLimited': 0, 'malformed': 0}
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None  # set by serve()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/stats':
+            with self.state.lock:
+                self._send(200, dict(self.state.counts))
+        else:
+            self._send(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': 'Not found'}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        if not self.path.startswith('/v1/messages'):
+            return self._send(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': 'Not found'}})
+        state = self.state
+        state.count('requests')
+        time.sleep(max(0.0, state.latency()))
+
+        roll = random.random()
+        if roll < state.rate_limit_rate:
+            state.count('rateLimited')
+            return self._send(429, {'type': 'error', 'error': {'type': 'rate_limit_error', 'message': 'Stub rate limit'}},
+                              {'retry-after': '1'})
+        if roll < state.rate_limit_rate + state.error_rate:
+            state.count('errors')
+            status = random.choice([500, 529])
+            kind = 'overloaded_error' if status == 529 else 'api_error'
+            return self._send(status, {'type': 'error', 'error': {'type': kind, 'message': 'Stub failure'}})
+
+        system = json.dumps(body.get('system', ''))
+        if 'IDEA_CONTEXT' in system:
+            text = REPLY
+        elif random.random() < state.malformed_rate:
+            state.count('malformed')
+            text = random.choice(MALFORMED)
+        else:
+            text = json.dumps({'ideas': [IDEA]})
+        prompt_chars = len(system) + len(json.dumps(body.get('messages', [])))
+        self._send(200, {
+            'id': f"msg_stub_{uuid.uuid4().hex[:16]}",
+            'type': 'message',
+            'role': 'assistant',
+            'model': body.get('model', 'stub'),
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': 'end_turn',
+            'stop_sequence': None,
+            'usage': {
+                'input_tokens': prompt_chars // 4,
+                'output_tokens': len(text) // 4,
+                'cache_creation_input_tokens': 0,
+                'cache_read_input_tokens': 0,
+            },
+        })
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(port, state):
+    handler = type('StubHandler', (Handler,), {'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', default='lognormal:1.5,0.5')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of 500/529 responses')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of 429 responses')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='Fraction of malformed idea responses')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    state = StubState(parse_latency(args.latency), args.error_rate, args.rate_limit_rate, args.malformed_rate)
+    server = serve(args.port, state)
+    print(f"Stub Claude API on http://127.0.0.1:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""Offline bulk generation from a JSONL file of business descriptions.
+
+Each input line is either a JSON string or an object with an ``idea``,
+``description`` or ``text`` field and an optional ``id``. Results are
+written as NDJSON in input order, one line per item, with the same shape
+as the /content-catalyst response plus ``index`` (and ``id``).
+
+Re-running with the same ``--output`` resumes after the last complete line,
+so a crash at item 800 does not redo the first 799. With ``--use-batches``
+the remaining items go through the Message Batches API instead; the batch
+ID is checkpointed next to the output so a restart polls the same batch
+rather than submitting a new one.
+
+Usage:
+    python bulk.py descriptions.jsonl -o ideas.ndjson [--concurrency 8]
+    python bulk.py descriptions.jsonl -o ideas.ndjson --use-batches
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import app
+
+
+def read_items(path):
+    stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    items = []
+    with stream:
+        for lineno, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                raise SystemExit(f"{path}:{lineno}: not valid JSON")
+    return items
+
+
+def resume_point(output):
+    """Index to resume from, dropping a partially written last line."""
+    if not output or not os.path.exists(output):
+        return 0
+    start = 0
+    keep = 0
+    with open(output, 'rb') as f:
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break
+            try:
+                start = json.loads(raw)['index'] + 1
+            except (ValueError, KeyError, TypeError):
+                break
+            keep += len(raw)
+    with open(output, 'r+b') as f:
+        f.truncate(keep)
+    return start
+
+
+def _batch_api_result(index, item, message=None, error=None):
+    business_description = app.batch_item_description(item)
+    ideas = None
+    if message is not None:
+        usage = app.record_usage('batch', message)
+        try:
+            ideas = app.parse_ideas_response(message.content[0].text.strip())
+            app.store_ideas(business_description, ideas, 'claude-batch', model=message.model, usage=usage)
+        except Exception as e:
+            error = f"Claude API error: {str(e)}"
+    if not ideas:
+        ideas = app.generate_marketing_ideas(business_description)
+    result = {
+        'status': 'success',
+        'input': business_description,
+        'ideas': ideas,
+        'source': 'claude' if ideas and not error else 'local',
+        'index': index,
+    }
+    if error:
+        result['error'] = error
+    if isinstance(item, dict) and 'id' in item:
+        result['id'] = item['id']
+    return result
+
+
+def items_digest(items):
+    """Hash of the parsed input items, so a checkpoint is only reused for the same input."""
+    encoded = json.dumps(items, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def iter_message_batch_results(items, start, checkpoint, poll_interval):
+    """Run ``items[start:]`` through the Message Batches API, yielding results in order.
+
+    A batch saved in ``checkpoint`` is reused if it was submitted for the
+    same input (compared by ``items_digest``) and covers ``items[start:]``:
+    after a partial write the output already has some of its results, so
+    ``start`` is past the batch's own start, and submitting again would pay
+    for the rest twice.
+    """
+    batch_id = None
+    digest = items_digest(items)
+    if os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            saved = json.load(f)
+        if (saved.get('digest') == digest and saved.get('count') == len(items)
+                and saved.get('start', len(items)) <= start):
+            batch_id = saved['batch_id']
+            print(f"Resuming message batch {batch_id}", file=sys.stderr)
+
+    blank = set()
+    for i in range(start, len(items)):
+        description = app.batch_item_description(items[i])
+        if not isinstance(description, str) or not description.strip():
+            blank.add(i)
+    if batch_id is None:
+        requests = [
+            {'custom_id': str(i), 'params': app.build_idea_request(app.batch_item_description(items[i]))}
+            for i in range(start, len(items)) if i not in blank
+        ]
+        batch_id = app.claude.messages.batches.create(requests=requests).id
+        with open(checkpoint, 'w') as f:
+            json.dump({'batch_id': batch_id, 'start': start, 'count': len(items), 'digest': digest}, f)
+        print(f"Submitted message batch {batch_id} ({len(requests)} requests)", file=sys.stderr)
+
+    while True:
+        batch = app.claude.messages.batches.retrieve(batch_id)
+        if batch.processing_status == 'ended':
+            break
+        time.sleep(poll_interval)
+
+    outcomes = {}
+    for entry in app.claude.messages.batches.results(batch_id):
+        outcomes[int(entry.custom_id)] = entry.result
+
+    for index in range(start, len(items)):
+        if index in blank:
+            yield {'status': 'error', 'message': 'Please provide a business idea/description.', 'index': index}
+            continue
+        outcome = outcomes.get(index)
+        if outcome is not None and outcome.type == 'succeeded':
+            yield _batch_api_result(index, items[index], message=outcome.message)
+        else:
+            kind = outcome.type if outcome is not None else 'missing'
+            yield _batch_api_result(index, items[index], error=f"Message batch request {kind}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-generate content ideas from a JSONL file.')
+    parser.add_argument('input', help="JSONL file of descriptions ('-' for stdin)")
+    parser.add_argument('-o', '--output', help='NDJSON output file (enables resume); defaults to stdout')
+    parser.add_argument('--concurrency', type=int, default=app.IDEA_BATCH_CONCURRENCY)
+    parser.add_argument('--use-batches', action='store_true',
+                        help='Use the Message Batches API (cheaper, but results can take hours)')
+    parser.add_argument('--poll-interval', type=float, default=30, help='Seconds between batch status checks')
+    args = parser.parse_args()
+
+    items = read_items(args.input)
+    start = resume_point(args.output)
+    if start >= len(items):
+        print(f"All {len(items)} items already done", file=sys.stderr)
+        return
+    if start:
+        print(f"Resuming at item {start} of {len(items)}", file=sys.stderr)
+
+    use_batches = args.use_batches
+    if use_batches and not (app.claude and hasattr(app.claude.messages, 'batches')):
+        print("Message Batches API not available; using concurrent requests", file=sys.stderr)
+        use_batches = False
+    if use_batches and not args.output:
+        raise SystemExit("--use-batches needs --output so the batch can be resumed")
+
+    if use_batches:
+        checkpoint = args.output + '.batch.json'
+        results = iter_message_batch_results(items, start, checkpoint, args.poll_interval)
+    else:
+        checkpoint = None
+        results = app.iter_batch_results(items, max(1, args.concurrency), start)
+
+    out = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for result in results:
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""Gunicorn settings, picked up automatically by ``gunicorn app:app``.
+
+Two serving modes, chosen with GUNICORN_WORKER_CLASS:
+
+- ``sync`` (default): one request per worker process. Every request pins
+  its worker for the full Claude latency, so concurrency == WEB_CONCURRENCY.
+- ``gevent``: cooperative workers. The socket layer is monkey-patched, so a
+  worker waiting on Claude serves other requests meanwhile; each worker can
+  hold up to GUNICORN_WORKER_CONNECTIONS requests in flight and shares one
+  pooled Claude HTTP client (CLAUDE_MAX_CONNECTIONS) across them.
+
+See the README "Serving" section for sizing.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+
+if worker_class == 'gevent':
+    workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 200))
+else:
+    workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# Workers inherit this, so each takes its share of CLAUDE_RPM/CLAUDE_TPM.
+os.environ['WEB_CONCURRENCY'] = str(workers)
+
+# Generations take up to IDEA_DEADLINE (25s) and streams/batches longer, so
+# the default 30s worker timeout is too tight for sync workers.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+keepalive = 5
+
+# Don't preload: the app must be imported after gevent has patched the
+# worker, or the Claude client and locks would use blocking primitives.
+preload_app = False
@@ -82,6 +82,7 @@ document.addEventListener('DOMContentLoaded', () => {
   function mapBackendIdea(raw, budget){
     return {
       id: raw.id || raw.title,
+      sessionId: raw.id || null,
       title: raw.title || raw.headline || 'Untitled idea',
       format: raw.format || 'Reel',
       tone: raw.tone || 'neutral',
@@ -141,6 +142,55 @@ document.addEventListener('DOMContentLoaded', () => {
     showPage('ideas');
   }
 
+  // Reads server-sent events from /content-catalyst/stream, rendering a
+  // partial card while fields arrive. Resolves true once the final ideas are
+  // rendered, false if the stream ended without them.
+  async function streamIdeas(description, budget){
+    const resp = await fetch('/content-catalyst/stream', {
+      method:'POST', headers:{'Content-Type':'application/json'},
+      body: JSON.stringify({description})
+    });
+    if(!resp.ok || !resp.body) return false;
+
+    const reader = resp.body.getReader();
+    const decoder = new TextDecoder();
+    const partial = {};
+    let buffer = '';
+    let shown = false;
+
+    while(true){
+      const {value, done} = await reader.read();
+      if(done) return false;
+      buffer += decoder.decode(value, {stream:true});
+
+      let sep;
+      while((sep = buffer.indexOf('\n\n')) >= 0){
+        const block = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+        let event = 'message', data = '';
+        block.split('\n').forEach(line => {
+          if(line.startsWith('event:')) event = line.slice(6).trim();
+          else if(line.startsWith('data:')) data += line.slice(5).trim();
+        });
+        if(!data) continue;
+        const payload = JSON.parse(data);
+
+        if(event === 'field' && payload.index === 0){
+          partial[payload.field] = payload.value;
+          ideasGrid.innerHTML = '';
+          ideasGrid.appendChild(makeIdeaCard(mapBackendIdea(partial, budget)));
+          if(!shown){ showPage('ideas'); shown = true; }
+        } else if(event === 'done'){
+          if(payload && Array.isArray(payload.ideas) && payload.ideas.length > 0){
+            renderIdeas(payload.ideas.map(raw => mapBackendIdea(raw, budget)));
+            return true;
+          }
+          return false;
+        }
+      }
+    }
+  }
+
   async function generateIdeas(){
     const description = descEl.value.trim();
     const format = formatEl.value;
@@ -154,6 +204,13 @@ document.addEventListener('DOMContentLoaded', () => {
 
     ideasGrid.innerHTML = '<div class="muted">Generating ideas…</div>';
 
+    // Prefer the streaming endpoint so fields show up as soon as they're written
+    try{
+      if(await streamIdeas(description, budget)) return;
+    }catch(err){
+      console.error('Streaming error, retrying without streaming:', err);
+    }
+
     // Try backend first
     try{
       console.log('Sending request to backend...'); // Debug log
@@ -252,12 +309,20 @@ document.addEventListener('DOMContentLoaded', () => {
         inputEl.value = '';
         sendBtn.disabled = true; sendBtn.textContent = 'Thinking...';
         try{
-          const resp = await fetch('/idea-chat', {
+          // The server keeps the conversation per idea_id; only resend the
+          // whole idea if that session has expired.
+          const post = (body) => fetch('/idea-chat', {
             method:'POST', headers:{'Content-Type':'application/json'},
-            body: JSON.stringify({idea: idea, question: q})
+            body: JSON.stringify(body)
           });
+          let resp = idea.sessionId ? await post({idea_id: idea.sessionId, question: q}) : null;
+          if(!resp || resp.status === 404){
+            const {id, sessionId, ...ideaBody} = idea;
+            resp = await post({idea: ideaBody, question: q});
+          }
           if(resp.ok){
             const data = await resp.json();
+            if(data && data.idea_id) idea.sessionId = data.idea_id;
             if(data && data.reply){
               appendMsg('Editor AI', data.reply);
             } else {
@@ -0,0 +1,156 @@
+"""Tests for the stateful concurrency pieces in app.py: the circuit breaker,
+the Claude scheduler and the generation cache's single-flight dedup."""
+import threading
+import time
+
+import pytest
+
+from app import (PRIORITY_BATCH, PRIORITY_CHAT, PRIORITY_INTERACTIVE, CircuitBreaker,
+                 ClaudeOverloadedError, ClaudeScheduler, GenerationCache)
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "condition not reached in time"
+        time.sleep(0.005)
+
+
+def make_breaker(cooldown=0.05):
+    return CircuitBreaker(window=60, min_calls=2, error_rate=0.5, slow_call=10, cooldown=cooldown, probes=1)
+
+
+def test_breaker_opens_then_half_open_probe_closes_it():
+    breaker = make_breaker()
+    breaker.record(False, 0.1)
+    assert breaker.state == 'closed'
+    breaker.record(False, 0.1)
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()          # the single probe
+    assert not breaker.allow()      # no second probe while it is in flight
+    breaker.record(True, 0.1)
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+
+def test_breaker_failed_probe_reopens():
+    breaker = make_breaker()
+    breaker.record(False, 0.1)
+    breaker.record(False, 0.1)
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(False, 0.1)
+    assert breaker.state == 'open'
+    assert breaker.times_opened == 2
+    assert not breaker.allow()
+
+
+def test_breaker_counts_slow_calls_as_failures():
+    breaker = make_breaker()
+    breaker.record(True, 11)
+    breaker.record(True, 12)
+    assert breaker.state == 'open'
+
+
+def _hold_slot(scheduler, priority, outcome, release=None):
+    """Thread body: take a slot, record what happened, hold it until ``release``."""
+    try:
+        with scheduler.slot('ideas', priority, 100, timeout=2):
+            outcome.append('admitted')
+            if release is not None:
+                release.wait(2)
+    except ClaudeOverloadedError as e:
+        outcome.append(e)
+
+
+def test_scheduler_evicts_lowest_priority_waiter_when_queue_is_full():
+    scheduler = ClaudeScheduler(rpm=0, tpm=0, max_concurrency=1, max_queue=1, max_wait=2)
+    release = threading.Event()
+    holder, batch, chat = [], [], []
+    threads = [threading.Thread(target=_hold_slot, args=(scheduler, PRIORITY_INTERACTIVE, holder, release))]
+    threads[0].start()
+    wait_until(lambda: holder == ['admitted'])
+
+    threads.append(threading.Thread(target=_hold_slot, args=(scheduler, PRIORITY_BATCH, batch)))
+    threads[1].start()
+    wait_until(lambda: scheduler.stats()['queued'] == 1)
+
+    threads.append(threading.Thread(target=_hold_slot, args=(scheduler, PRIORITY_CHAT, chat)))
+    threads[2].start()
+    wait_until(lambda: batch != [])
+    assert isinstance(batch[0], ClaudeOverloadedError)
+    assert 'evicted' in str(batch[0])
+
+    release.set()
+    for thread in threads:
+        thread.join(2)
+    assert chat == ['admitted']
+    assert scheduler.shed == 1
+
+
+def test_scheduler_rejects_call_it_cannot_outrank():
+    scheduler = ClaudeScheduler(rpm=0, tpm=0, max_concurrency=1, max_queue=0, max_wait=2)
+    with pytest.raises(ClaudeOverloadedError, match='queue full'):
+        scheduler.check_queue('ideas', PRIORITY_INTERACTIVE)
+    assert scheduler.shed == 1
+
+
+def test_scheduler_queue_timeout_sheds_with_retry_after():
+    scheduler = ClaudeScheduler(rpm=30, tpm=0, max_concurrency=1, max_queue=10, max_wait=2)
+    with scheduler.slot('ideas', PRIORITY_INTERACTIVE, 100):
+        started = time.time()
+        with pytest.raises(ClaudeOverloadedError, match='queue timeout') as excinfo:
+            with scheduler.slot('ideas', PRIORITY_INTERACTIVE, 100, timeout=0.05):
+                pass
+        assert time.time() - started < 1
+    # One call in flight at 30 RPM drains in 2s.
+    assert excinfo.value.retry_after == 2
+    assert scheduler.stats()['queued'] == 0
+    assert scheduler.stats()['inflight'] == 0
+
+
+def test_scheduler_rpm_bucket_delays_then_admits():
+    scheduler = ClaudeScheduler(rpm=600, tpm=0, max_concurrency=4, max_queue=10, max_wait=2)
+    scheduler.throttle()  # as after a 429: empty bucket, refills 10 requests/s
+    started = time.time()
+    with scheduler.slot('ideas', PRIORITY_INTERACTIVE, 100):
+        waited = time.time() - started
+    assert 0.05 < waited < 1
+
+
+def test_single_flight_propagates_leader_error_to_waiters():
+    cache = GenerationCache(max_entries=10, ttl=60, max_bytes=1 << 20)
+    release = threading.Event()
+    calls = []
+
+    def failing():
+        calls.append(1)
+        release.wait(2)
+        raise RuntimeError('claude down')
+
+    errors = []
+
+    def caller():
+        try:
+            cache.get_or_generate('k', failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=caller) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: cache.coalesced == 2)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert len(calls) == 1
+    assert [str(e) for e in errors] == ['claude down'] * 3
+    assert cache.stats()['entries'] == 0
+
+    value, status = cache.get_or_generate('k', lambda: [{'title': 'ok'}])
+    assert (value, status) == ([{'title': 'ok'}], 'miss')
+    assert cache.get_or_generate('k', lambda: None) == ([{'title': 'ok'}], 'hit')